@@ -1,10 +1,24 @@
 from django.contrib import admin
 
-from ims.models import IMSArchive, LTIApp, LTITenant
+from ims.models import IMSArchive, IMSResource, LTIApp, LTITenant, LTIOutcome
 
 
 class IMSArchiveAdmin(admin.ModelAdmin):
-    list_display = ('__str__', 'created_at', 'metadata_tag')
+    list_display = ('__str__', 'title', 'schema_type', 'schema_version', 'exported_at', 'license', 'created_at')
+    list_filter = ('schema_type', 'schema_version', 'license',)
+    search_fields = ('title', 'file',)
+    readonly_fields = ('title', 'schema_type', 'schema_version', 'exported_at', 'license', 'metadata_tag',)
+
+
+class IMSResourceAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'archive', 'title', 'main')
+    list_filter = ('content_type',)
+    search_fields = ('identifier', 'title', 'main',)
+    list_select_related = ('archive',)
+    raw_id_fields = ('archive',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('archive__manifest')
 
 
 class LTIAppAdmin(admin.ModelAdmin):
@@ -16,6 +30,17 @@ class LTITenantAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('organization',)}
 
 
+class LTIOutcomeAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'tenant', 'score', 'status', 'attempts', 'next_attempt_at', 'modified_at')
+    list_filter = ('status',)
+    search_fields = ('sourcedid',)
+    list_select_related = ('tenant__app',)
+    raw_id_fields = ('tenant',)
+    readonly_fields = ('last_error',)
+
+
 admin.site.register(IMSArchive, IMSArchiveAdmin)
+admin.site.register(IMSResource, IMSResourceAdmin)
 admin.site.register(LTIApp, LTIAppAdmin)
 admin.site.register(LTITenant, LTITenantAdmin)
+admin.site.register(LTIOutcome, LTIOutcomeAdmin)
@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ImsConfig(AppConfig):
     name = 'ims'
+
+    def ready(self):
+        if getattr(settings, "IMS_LAST_LOGIN_THROTTLE", None):
+            from django.contrib.auth.models import update_last_login as django_update_last_login
+            from django.contrib.auth.signals import user_logged_in
+            from ims.authorization.oauth_1 import update_last_login
+            user_logged_in.disconnect(django_update_last_login, dispatch_uid='update_last_login')
+            user_logged_in.connect(update_last_login, dispatch_uid='ims_update_last_login')
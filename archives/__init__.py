@@ -0,0 +1,5 @@
+from ims.archives.handles import ZipHandleCache, zip_handles
+from ims.archives.extraction import ExtractionCache, extraction_cache
+from ims.archives.ingestion import find_archives, ingest_archives, IngestionReport
+from ims.archives.zipstream import ZipStream, stream_zip
+from ims.archives.cartridge import CartridgeWriter
@@ -0,0 +1,207 @@
+import hashlib
+import posixpath
+from uuid import uuid4
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from lxml import etree
+
+from django.core.files import File
+
+from ims.archives.zipstream import ChunkBuffer, ChunkReader
+
+
+CC_NAMESPACE = "http://www.imsglobal.org/xsd/imsccv1p1/imscp_v1p1"
+LOM_NAMESPACE = "http://ltsc.ieee.org/xsd/imsccv1p1/LOM/manifest"
+XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
+SCHEMA_LOCATION = (
+    "http://www.imsglobal.org/xsd/imsccv1p1/imscp_v1p1 "
+    "http://www.imsglobal.org/profile/cc/ccv1p1/ccv1p1_imscp_v1p2_v1p0.xsd "
+    "http://ltsc.ieee.org/xsd/imsccv1p1/LOM/manifest "
+    "http://www.imsglobal.org/profile/cc/ccv1p1/LOM/ccv1p1_lommanifest_v1p0.xsd"
+)
+
+
+def iter_content_chunks(content, chunk_size=64 * 1024):
+    """
+    Yields the bytes of content, which can be bytes, a string, a file object or an iterable of bytes.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        yield bytes(content)
+    elif hasattr(content, "read"):
+        chunk = content.read(chunk_size)
+        while chunk:
+            yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            chunk = content.read(chunk_size)
+    else:
+        for chunk in content:
+            yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+
+class CartridgeWriter(object):
+    """
+    Writes an IMS Common Cartridge without intermediate files.
+    Resource files go into the archive as soon as they are written, while the writer only remembers
+    the identifiers, titles and hrefs that the imsmanifest.xml needs. The manifest gets generated incrementally
+    when the writer closes, because organizations come before resources in a manifest.
+    Writing methods are generators that yield the bytes of the archive that are ready,
+    which means that nothing gets written until they are consumed.
+    Files get a checksum with the hashlib algorithm of checksum while they are written, unless checksum is None.
+    """
+
+    def __init__(self, title, identifier=None, schema_version="1.1.0", language="en", license=None,
+                 exported_at=None, checksum="sha256", compression=ZIP_DEFLATED):
+        self.title = title
+        self.identifier = identifier or "cartridge_{}".format(uuid4().hex)
+        self.schema_version = schema_version
+        self.language = language
+        self.license = license
+        self.exported_at = exported_at
+        self.checksum = checksum
+        self.checksums = {}
+        self.items = []
+        self.resources = []
+        self.buffer = ChunkBuffer()
+        self.zip_file = ZipFile(self.buffer, "w", compression=compression)
+
+    @staticmethod
+    def get_member_name(href):
+        return posixpath.normpath(href).lstrip("/")
+
+    def write_file(self, href, content):
+        """
+        Adds a file to the archive under href and yields archive bytes while the content gets written.
+        """
+        name = self.get_member_name(href)
+        if name in self.checksums:
+            raise ValueError("The cartridge already contains {}".format(name))
+        file_hash = hashlib.new(self.checksum) if self.checksum else None
+        with self.zip_file.open(name, "w") as member:
+            for chunk in iter_content_chunks(content):
+                member.write(chunk)
+                if file_hash is not None:
+                    file_hash.update(chunk)
+                data = self.buffer.drain()
+                if data:
+                    yield data
+        self.checksums[name] = file_hash.hexdigest() if file_hash is not None else None
+        data = self.buffer.drain()
+        if data:
+            yield data
+
+    def write_resource(self, identifier, files, content_type="webcontent", title=None, main=None):
+        """
+        Adds a resource with files as (href, content) pairs and yields archive bytes while the files get written.
+        Files with None as content refer to files that an earlier resource wrote.
+        Resources with a title get an item in the organization of the cartridge.
+        The main file defaults to the first file for webcontent resources.
+        """
+        hrefs = []
+        for href, content in files:
+            if content is not None:
+                yield from self.write_file(href, content)
+            elif self.get_member_name(href) not in self.checksums:
+                raise ValueError("The cartridge does not contain {}".format(href))
+            hrefs.append(href)
+        if main is None and content_type == "webcontent" and hrefs:
+            main = hrefs[0]
+        self.resources.append((identifier, content_type, main, hrefs,))
+        if title is not None:
+            self.items.append((identifier, title,))
+
+    def write_metadata(self, xml):
+        with xml.element("{%s}metadata" % CC_NAMESPACE):
+            with xml.element("{%s}schema" % CC_NAMESPACE):
+                xml.write("IMS Common Cartridge")
+            with xml.element("{%s}schemaversion" % CC_NAMESPACE):
+                xml.write(self.schema_version)
+            with xml.element("{%s}lom" % LOM_NAMESPACE):
+                with xml.element("{%s}general" % LOM_NAMESPACE):
+                    with xml.element("{%s}title" % LOM_NAMESPACE):
+                        with xml.element("{%s}string" % LOM_NAMESPACE, language=self.language):
+                            xml.write(self.title)
+                if self.exported_at is not None:
+                    with xml.element("{%s}lifeCycle" % LOM_NAMESPACE):
+                        with xml.element("{%s}contribute" % LOM_NAMESPACE):
+                            with xml.element("{%s}date" % LOM_NAMESPACE):
+                                with xml.element("{%s}dateTime" % LOM_NAMESPACE):
+                                    xml.write(self.exported_at.isoformat())
+                if self.license is not None:
+                    with xml.element("{%s}rights" % LOM_NAMESPACE):
+                        with xml.element("{%s}copyrightAndOtherRestrictions" % LOM_NAMESPACE):
+                            with xml.element("{%s}value" % LOM_NAMESPACE):
+                                xml.write("yes")
+                        with xml.element("{%s}description" % LOM_NAMESPACE):
+                            with xml.element("{%s}string" % LOM_NAMESPACE, language=self.language):
+                                xml.write(self.license)
+
+    def write_manifest(self):
+        """
+        Writes the imsmanifest.xml element by element and yields archive bytes while it gets written.
+        """
+        namespaces = {None: CC_NAMESPACE, "lomimscc": LOM_NAMESPACE, "xsi": XSI_NAMESPACE}
+        with self.zip_file.open("imsmanifest.xml", "w") as member:
+            with etree.xmlfile(member, encoding="utf-8") as xml:
+                xml.write_declaration()
+                manifest_attributes = {
+                    "identifier": self.identifier,
+                    "{%s}schemaLocation" % XSI_NAMESPACE: SCHEMA_LOCATION
+                }
+                with xml.element("{%s}manifest" % CC_NAMESPACE, manifest_attributes, nsmap=namespaces):
+                    self.write_metadata(xml)
+                    with xml.element("{%s}organizations" % CC_NAMESPACE):
+                        organization_attributes = {"identifier": "organization", "structure": "rooted-hierarchy"}
+                        with xml.element("{%s}organization" % CC_NAMESPACE, organization_attributes):
+                            with xml.element("{%s}item" % CC_NAMESPACE, identifier="root"):
+                                for identifier, title in self.items:
+                                    item_attributes = {
+                                        "identifier": "item_{}".format(identifier),
+                                        "identifierref": identifier
+                                    }
+                                    with xml.element("{%s}item" % CC_NAMESPACE, item_attributes):
+                                        with xml.element("{%s}title" % CC_NAMESPACE):
+                                            xml.write(title)
+                                    xml.flush()
+                                    data = self.buffer.drain()
+                                    if data:
+                                        yield data
+                    with xml.element("{%s}resources" % CC_NAMESPACE):
+                        for identifier, content_type, main, hrefs in self.resources:
+                            resource_attributes = {"identifier": identifier, "type": content_type}
+                            if main is not None:
+                                resource_attributes["href"] = main
+                            with xml.element("{%s}resource" % CC_NAMESPACE, resource_attributes):
+                                for href in hrefs:
+                                    with xml.element("{%s}file" % CC_NAMESPACE, href=href):
+                                        pass
+                            xml.flush()
+                            data = self.buffer.drain()
+                            if data:
+                                yield data
+        data = self.buffer.drain()
+        if data:
+            yield data
+
+    def close(self):
+        """
+        Writes the manifest and the central directory and yields the remaining bytes of the archive.
+        """
+        yield from self.write_manifest()
+        self.zip_file.close()
+        yield self.buffer.drain()
+
+    def stream(self, resources):
+        """
+        Yields the bytes of the cartridge with resources as dictionaries of write_resource arguments,
+        which makes it possible to pass the cartridge to a StreamingHttpResponse.
+        """
+        for resource in resources:
+            yield from self.write_resource(**resource)
+        yield from self.close()
+
+    def save(self, storage, name, resources):
+        """
+        Saves the cartridge with resources to a storage backend and returns the name that the storage used.
+        """
+        return storage.save(name, File(ChunkReader(self.stream(resources)), name=name))
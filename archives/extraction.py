@@ -0,0 +1,242 @@
+import os
+import time
+import shutil
+import fcntl
+import tempfile
+from uuid import uuid4
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from ims.archives.handles import ZipHandleCache
+
+
+def get_directory_mode():
+    # Reading the umask requires setting it, so we set it back immediately
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o777 & ~umask
+
+
+def get_member_path(root, filename):
+    """
+    Returns the path where an archive member should get extracted to.
+    Just like ZipFile.extract this removes drive letters, absolute paths and parent directory references.
+    """
+    filename = filename.replace("\\", "/")
+    parts = [
+        part for part in filename.split("/")
+        if part and part not in (".", "..",) and not part.endswith(":")
+    ]
+    return os.path.join(root, *parts)
+
+
+class ExtractionCache(object):
+    """
+    Manages extracted archives inside a single directory.
+
+    Extractions happen in a temporary directory that gets renamed once all members are written,
+    which means that a destination directory is always complete.
+    A file lock per archive makes sure only one process extracts an archive while other processes wait for it.
+    Every access touches the destination directory and when the total size of all extractions
+    exceeds the budget the least recently used extractions get removed.
+    Use reading to hold a shared lock while reading files, because extractions are never removed while they are read.
+    """
+
+    TEMPORARY_SUFFIX = ".extracting"
+    STALE_TEMPORARY_AGE = 24 * 60 * 60
+
+    def __init__(self, root, budget=None, workers=4):
+        self.root = root
+        self.budget = budget
+        self.workers = workers
+        self.directory_mode = get_directory_mode()
+
+    def get_destination(self, name):
+        tail, head = os.path.split(name)
+        return os.path.join(self.root, head)
+
+    def _get_hidden_path(self, destination, extension):
+        tail, head = os.path.split(destination)
+        return os.path.join(tail, ".{}.{}".format(head, extension))
+
+    @contextmanager
+    def lock(self, destination, blocking=True, shared=False):
+        """
+        Holds an exclusive lock for the destination, or a shared lock when shared is True.
+        Yields whether the lock was acquired, which is always True unless blocking is False.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+        with open(self._get_hidden_path(destination, "lock"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, operation)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def touch(destination):
+        try:
+            os.utime(destination)
+        except FileNotFoundError:
+            pass
+
+    def extract(self, storage, name):
+        """
+        Returns the directory with the extracted content of the archive stored under name.
+        The archive only gets extracted when it is not in the cache already.
+        """
+        destination = self.get_destination(name)
+        if os.path.isdir(destination):
+            self.touch(destination)
+            return destination
+        with self.lock(destination):
+            if os.path.isdir(destination):  # another process finished the extraction while we waited
+                self.touch(destination)
+                return destination
+            temporary = tempfile.mkdtemp(
+                dir=self.root,
+                prefix=".{}.".format(os.path.basename(destination)),
+                suffix=self.TEMPORARY_SUFFIX
+            )
+            try:
+                size = self._extract_members(storage, name, temporary)
+                with open(self._get_hidden_path(destination, "size"), "w") as size_file:
+                    size_file.write(str(size))
+                # mkdtemp only gives access to the owner, while extractions should be readable like other media
+                os.chmod(temporary, self.directory_mode)
+                os.rename(temporary, destination)
+            except Exception:
+                shutil.rmtree(temporary, ignore_errors=True)
+                raise
+        self.evict(keep=destination)
+        return destination
+
+    @contextmanager
+    def reading(self, storage, name):
+        """
+        Extracts the archive stored under name when needed and yields the directory with its content.
+        The extraction can't be removed while the context is active.
+        """
+        while True:
+            destination = self.extract(storage, name)
+            # The shared lock can't be taken while extracting, because extract takes the exclusive lock
+            with self.lock(destination, shared=True):
+                if not os.path.isdir(destination):  # removed before we acquired the lock
+                    continue
+                yield destination
+                return
+
+    def _extract_members(self, storage, name, destination):
+        with ZipHandleCache.open(storage, name) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+        # We create all directories upfront to prevent threads from racing to create the same directory
+        directories = set(os.path.dirname(get_member_path(destination, info.filename)) for info in members)
+        for directory in directories:
+            os.makedirs(directory, exist_ok=True)
+        # Members get divided over workers by size, to balance the workload
+        workers = max(1, min(self.workers, len(members)))
+        batches = [[] for _ in range(workers)]
+        sizes = [0] * workers
+        for info in sorted(members, key=lambda member: member.file_size, reverse=True):
+            index = sizes.index(min(sizes))
+            batches[index].append(info)
+            sizes[index] += info.file_size
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(lambda batch: self._extract_batch(storage, name, destination, batch), batches):
+                pass
+        return sum(sizes)
+
+    @staticmethod
+    def _extract_batch(storage, name, destination, members):
+        # Every thread reads through its own ZipFile to decompress in parallel
+        with ZipHandleCache.open(storage, name) as archive:
+            for info in members:
+                with archive.open(info) as source, open(get_member_path(destination, info.filename), "wb") as target:
+                    shutil.copyfileobj(source, target)
+
+    def get_size(self, destination):
+        try:
+            with open(self._get_hidden_path(destination, "size")) as size_file:
+                return int(size_file.read())
+        except (FileNotFoundError, ValueError):
+            pass
+        size = 0
+        for directory, directories, files in os.walk(destination):
+            for file in files:
+                try:
+                    size += os.path.getsize(os.path.join(directory, file))
+                except OSError:
+                    pass
+        return size
+
+    def remove(self, destination):
+        """
+        Removes an extraction unless another process is extracting or reading it.
+        Returns whether the extraction got removed.
+        """
+        with self.lock(destination, blocking=False) as acquired:
+            if not acquired:
+                return False
+            # Renaming first makes the extraction disappear at once, instead of file by file
+            temporary = os.path.join(
+                self.root,
+                ".{}.{}{}".format(os.path.basename(destination), uuid4().hex, self.TEMPORARY_SUFFIX)
+            )
+            try:
+                os.rename(destination, temporary)
+            except FileNotFoundError:
+                return False
+            shutil.rmtree(temporary, ignore_errors=True)
+            try:
+                os.remove(self._get_hidden_path(destination, "size"))
+            except FileNotFoundError:
+                pass
+            # Lock files stay, because removing them would allow two processes to lock the same destination
+            return True
+
+    def evict(self, keep=None):
+        """
+        Removes least recently used extractions until the total size fits the budget.
+        Leftovers from crashed extractions get removed as well.
+        """
+        if self.budget is None or not os.path.isdir(self.root):
+            return
+        destination = os.path.join(self.root, ".evict")
+        with self.lock(destination, blocking=False) as acquired:
+            if not acquired:  # another process is evicting already
+                return
+            extractions = []
+            now = time.time()
+            for entry in os.scandir(self.root):
+                if not entry.is_dir():
+                    continue
+                if entry.name.startswith("."):
+                    if entry.name.endswith(self.TEMPORARY_SUFFIX) and \
+                            now - entry.stat().st_mtime > self.STALE_TEMPORARY_AGE:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                extractions.append((entry.stat().st_mtime, entry.path, self.get_size(entry.path),))
+            total = sum(size for modified_at, path, size in extractions)
+            for modified_at, path, size in sorted(extractions):
+                if total <= self.budget:
+                    break
+                if path == keep:
+                    continue
+                if self.remove(path):
+                    total -= size
+
+
+extraction_cache = ExtractionCache(
+    os.path.join(settings.MEDIA_ROOT, "tmp"),
+    budget=getattr(settings, "IMS_EXTRACTION_CACHE_BUDGET", None),
+    workers=getattr(settings, "IMS_EXTRACTION_WORKERS", 4)
+)
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from threading import RLock
+from zipfile import ZipFile
+
+from django.conf import settings
+
+
+class StorageZipFile(ZipFile):
+    """
+    A ZipFile over a file from a storage without local paths, like a remote storage stream.
+    ZipFile never closes file objects that it gets passed, so this ZipFile takes ownership of the storage file.
+    It gets closed after the ZipFile and all its opened members are closed, just like files that ZipFile opens itself.
+    """
+
+    def __init__(self, file, *args, **kwargs):
+        try:
+            super().__init__(file, *args, **kwargs)
+        except Exception:
+            file.close()
+            raise
+        self._filePassed = False
+
+
+class ZipHandleCache(object):
+    """
+    Keeps a limited number of opened ZipFile instances around, so that reading members repeatedly
+    does not need to re-open the archive and re-scan its central directory.
+    The least recently used handles get closed once the cache is full.
+    Handles are keyed by storage name. Call discard when the file under a name gets replaced.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._handles = OrderedDict()
+        self._lock = RLock()
+
+    def get(self, storage, name):
+        with self._lock:
+            handle = self._handles.pop(name, None)
+            if handle is None:
+                handle = self.open(storage, name)
+            self._handles[name] = handle
+            while len(self._handles) > self.size:
+                stale_name, stale_handle = self._handles.popitem(last=False)
+                stale_handle.close()
+            return handle
+
+    def open_member(self, storage, name, member):
+        # Members are opened while holding the lock, because an evicted ZipFile can't open members any longer.
+        # Members that are already open keep working after eviction.
+        with self._lock:
+            return self.get(storage, name).open(member)
+
+    @staticmethod
+    def open(storage, name):
+        try:
+            # ZipFile only closes files it opened itself after all opened members are closed as well
+            return ZipFile(storage.path(name))
+        except NotImplementedError:
+            return StorageZipFile(storage.open(name, "rb"))
+
+    def discard(self, name):
+        with self._lock:
+            handle = self._handles.pop(name, None)
+            if handle is not None:
+                handle.close()
+
+    def clear(self):
+        with self._lock:
+            while self._handles:
+                name, handle = self._handles.popitem()
+                handle.close()
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __contains__(self, name):
+        return name in self._handles
+
+
+zip_handles = ZipHandleCache(getattr(settings, "IMS_ZIP_HANDLE_CACHE_SIZE", 32))
@@ -0,0 +1,248 @@
+import os
+import posixpath
+from time import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.db import connections
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+
+
+ARCHIVE_EXTENSIONS = (".imscc", ".zip",)
+
+
+def get_storage_name(path, storage=default_storage):
+    """
+    Turns a file path inside the storage location into a name for the storage, just like IMSArchive.from_file_path.
+    Values that aren't file paths inside the storage location are returned as is.
+    """
+    location = getattr(storage, "location", None)
+    if location and os.path.isabs(path) and path.startswith(location):
+        path = path.replace(location, "", 1)
+    return path.lstrip("/")
+
+
+def find_archives(prefix="", storage=default_storage, extensions=ARCHIVE_EXTENSIONS):
+    """
+    Walks the storage from the prefix downwards and yields the names of all archive files it encounters.
+    """
+    directories, files = storage.listdir(prefix)
+    for file in sorted(files):
+        if file.lower().endswith(extensions):
+            yield posixpath.join(prefix, file)
+    for directory in sorted(directories):
+        yield from find_archives(posixpath.join(prefix, directory), storage=storage, extensions=extensions)
+
+
+UNCHANGED = "unchanged"
+CLEANED = "cleaned"
+DUPLICATE = "duplicate"
+FAILED = "failed"
+
+UPDATE_FIELDS = [
+    "manifest", "file_size", "file_modified_at", "file_hash", "manifest_hash",
+    "schema_type", "schema_version", "title", "exported_at", "license", "outline",
+]
+
+
+def get_archive_fields(archive):
+    """
+    Returns the fields of a cleaned archive and its pending resources as plain values,
+    which keeps parse state like BeautifulSoup trees out of the results that worker processes send back.
+    """
+    fields = {field: getattr(archive, field) for field in UPDATE_FIELDS}
+    fields.update(id=archive.pk, file=archive.file.name, pending_resources=archive.pending_resources)
+    return fields
+
+
+def read_archive(task):
+    """
+    Validates an archive and reads its manifest. This runs inside worker processes,
+    which only read from the database to find archives that are byte identical to new files.
+    The task is the name of the archive with the primary key, size, modification time and hash of a known archive
+    or with the size, modification time and hash of a known duplicate, which doesn't have a primary key.
+    Returns the name, a status and the fields of the cleaned archive, a new IMSArchiveDuplicate or an error message.
+    Known archives and duplicates with an unchanged size and modification time return without reading the file at all.
+    New files that are byte identical to a known archive return before their manifest gets read.
+    """
+    from ims.models import IMSArchive, IMSArchiveDuplicate
+    name, pk, file_size, file_modified_at, file_hash = task
+    # The name gets passed upon construction, because it determines whether the archive is a CommonCartridge
+    archive = IMSArchive(id=pk, file=name, file_size=file_size, file_modified_at=file_modified_at, file_hash=file_hash)
+    try:
+        if file_hash and not archive.has_file_changed():
+            return name, UNCHANGED if pk is not None else DUPLICATE, None
+        archive.update_file_fields()
+        if pk is None:
+            identical = IMSArchive.objects.filter(file_hash=archive.file_hash).values_list("id", flat=True).first()
+            if identical is not None:
+                return name, DUPLICATE, IMSArchiveDuplicate(
+                    archive_id=identical, file=name, file_size=archive.file_size,
+                    file_modified_at=archive.file_modified_at, file_hash=archive.file_hash
+                )
+        archive.update_manifest_fields()
+    except ValidationError as exc:
+        return name, FAILED, "; ".join(exc.messages)
+    except Exception as exc:
+        return name, FAILED, "{}: {}".format(exc.__class__.__name__, exc)
+    return name, CLEANED, get_archive_fields(archive)
+
+
+class IngestionReport(object):
+
+    def __init__(self):
+        self.started_at = time()
+        self.finished_at = None
+        self.processed = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.failures = []
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time()) - self.started_at
+
+    @property
+    def throughput(self):
+        elapsed = self.elapsed
+        return self.processed / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return "{} archives processed in {:.1f}s ({:.1f}/s), {} created, {} updated, {} unchanged, " \
+               "{} duplicates, {} failed".format(
+                   self.processed, self.elapsed, self.throughput, self.created, self.updated, self.unchanged,
+                   self.duplicates, len(self.failures)
+               )
+
+
+def get_ingestion_tasks(names, batch_size=500):
+    """
+    Returns the tasks for read_archive with the fingerprints of archives and duplicates that are known already.
+    """
+    from ims.models import IMSArchive, IMSArchiveDuplicate
+    names = list(names)
+    tasks = []
+    for start in range(0, len(names), batch_size):
+        batch = names[start:start + batch_size]
+        known = {
+            archive.file.name: archive
+            for archive in IMSArchive.objects.filter(file__in=batch)
+            .only("id", "file", "file_size", "file_modified_at", "file_hash")
+        }
+        duplicates = {duplicate.file: duplicate for duplicate in IMSArchiveDuplicate.objects.filter(file__in=batch)}
+        for name in batch:
+            archive = known.get(name, None)
+            duplicate = duplicates.get(name, None)
+            if archive is not None:
+                tasks.append((name, archive.id, archive.file_size, archive.file_modified_at, archive.file_hash,))
+            elif duplicate is not None:
+                tasks.append((name, None, duplicate.file_size, duplicate.file_modified_at, duplicate.file_hash,))
+            else:
+                tasks.append((name, None, None, None, None,))
+    return tasks
+
+
+def ingest_archives(names, processes=None, batch_size=500, progress=None):
+    """
+    Reads the archives with the given storage names in a process pool and creates or updates IMSArchive rows in batches.
+    Known archives are only read when their file changed and new archives that are byte identical
+    to a known archive are recorded as IMSArchiveDuplicate, which skips them on later runs until they change.
+    Archives that fail validation or can't be read get recorded as failures on the returned report,
+    without interrupting the other archives.
+    The progress callable gets called with the report after every batch.
+    """
+    from ims.models import IMSArchive, IMSArchiveDuplicate, IMSResource
+    from ims.models.content import set_primary_keys
+
+    report = IngestionReport()
+    batch = []
+    duplicates = []
+
+    def get_archive(fields):
+        pending_resources = fields.pop("pending_resources")
+        archive = IMSArchive(**fields)
+        archive.pending_resources = pending_resources
+        return archive
+
+    def flush():
+        if not batch and not duplicates:
+            return
+        archives = [get_archive(fields) for fields in batch]
+        updates = [archive for archive in archives if archive.pk is not None]
+        creates = []
+        identical = []
+        known_hashes = set(
+            IMSArchive.objects
+            .filter(file_hash__in=[archive.file_hash for archive in archives if archive.pk is None])
+            .values_list("file_hash", flat=True)
+        )
+        for archive in archives:
+            if archive.pk is not None:
+                continue
+            if archive.file_hash in known_hashes:
+                identical.append(archive)
+                continue
+            known_hashes.add(archive.file_hash)
+            creates.append(archive)
+        IMSArchive.objects.bulk_create(creates, batch_size=batch_size)
+        IMSArchive.objects.bulk_update(updates, UPDATE_FIELDS, batch_size=batch_size)
+        set_primary_keys(
+            creates, IMSArchive.objects.filter(file__in=[archive.file.name for archive in creates]), ["file"],
+            lambda archive: (archive.file.name,)
+        )
+        IMSResource.objects.index_archives(creates + updates, batch_size=batch_size)
+        # Archives that are identical to archives in the same batch are only found to be duplicates here
+        archive_ids = dict(
+            IMSArchive.objects.filter(file_hash__in=[archive.file_hash for archive in identical])
+            .values_list("file_hash", "id")
+        )
+        duplicates.extend(
+            IMSArchiveDuplicate(
+                archive_id=archive_ids[archive.file_hash], file=archive.file.name, file_size=archive.file_size,
+                file_modified_at=archive.file_modified_at, file_hash=archive.file_hash
+            )
+            for archive in identical
+        )
+        # Files that changed get a new duplicate record, while created archives aren't duplicates any longer
+        IMSArchiveDuplicate.objects.filter(
+            file__in=[duplicate.file for duplicate in duplicates] + [archive.file.name for archive in creates]
+        ).delete()
+        IMSArchiveDuplicate.objects.bulk_create(duplicates, batch_size=batch_size)
+        report.created += len(creates)
+        report.updated += len(updates)
+        report.duplicates += len(identical)
+        batch.clear()
+        duplicates.clear()
+        if progress is not None:
+            progress(report)
+
+    tasks = get_ingestion_tasks(names, batch_size=batch_size)
+    # Worker processes inherit the database connections when they fork.
+    # We close them to make sure no worker ever closes a connection that the main process is using.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {executor.submit(read_archive, task): task[0] for task in tasks}
+        for future in as_completed(futures):
+            # Results that can't be sent back from a worker only fail their own archive
+            try:
+                name, status, result = future.result()
+            except Exception as exc:
+                name, status, result = futures[future], FAILED, "{}: {}".format(exc.__class__.__name__, exc)
+            report.processed += 1
+            if status == UNCHANGED:
+                report.unchanged += 1
+            elif status == FAILED:
+                report.failures.append((name, result,))
+            elif status == DUPLICATE:
+                report.duplicates += 1
+                if result is not None:
+                    duplicates.append(result)
+            else:
+                batch.append(result)
+            if len(batch) + len(duplicates) >= batch_size:
+                flush()
+    flush()
+    report.finished_at = time()
+    return report
@@ -0,0 +1,91 @@
+from io import RawIOBase
+from zipfile import ZipFile, ZIP_DEFLATED
+
+
+class ChunkBuffer(object):
+    """
+    A write only file object that holds on to written bytes until they get drained.
+    ZipFile can write to it, because it keeps track of the position, but it doesn't support seeking.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ChunkReader(RawIOBase):
+    """
+    A read only file object over an iterable of bytes, which lets storage backends read streamed archives.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+class ZipStream(object):
+    """
+    Writes a zip archive in pieces. Every write returns the bytes of the archive that are ready,
+    which makes it possible to send an archive while it is being written without holding all of it in memory.
+    """
+
+    def __init__(self, compression=ZIP_DEFLATED):
+        self.buffer = ChunkBuffer()
+        self.zip_file = ZipFile(self.buffer, "w", compression=compression)
+
+    def write(self, name, data):
+        """
+        Adds a member with the given name and bytes or string as content and returns the bytes that are ready.
+        """
+        self.zip_file.writestr(name, data)
+        return self.buffer.drain()
+
+    def close(self):
+        """
+        Writes the central directory of the archive and returns the remaining bytes.
+        """
+        self.zip_file.close()
+        return self.buffer.drain()
+
+
+def stream_zip(members, compression=ZIP_DEFLATED):
+    """
+    Yields the bytes of a zip archive with the (name, content) pairs from members as files.
+    The members get read one at a time while the archive is consumed.
+    """
+    stream = ZipStream(compression=compression)
+    for name, content in members:
+        chunk = stream.write(name, content)
+        if chunk:
+            yield chunk
+    yield stream.close()
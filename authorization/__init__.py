@@ -1 +1,3 @@
+from ims.authorization.nonces import (NonceStore, DatabaseNonceStore, CacheNonceStore, MemoryNonceStore,
+                                      get_nonce_store)
 from ims.authorization.oauth_1 import LTIRequestValidator, LTIRemoteUserBackend
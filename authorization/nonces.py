@@ -0,0 +1,113 @@
+from time import time
+from threading import Lock
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, DataError
+from django.utils.module_loading import import_string
+
+
+class NonceStore(object):
+    """
+    Remembers nonces that have been used for a client key and timestamp to prevent replay attacks.
+    Nonces only need to be remembered for as long as their timestamp is accepted,
+    which is why stores receive the number of seconds that a nonce should be kept.
+    """
+
+    def add(self, client_key, timestamp, nonce, timeout):
+        """
+        Stores the nonce and returns True, or returns False when the nonce has been used before.
+        """
+        raise NotImplementedError("NonceStore subclasses should implement add")
+
+    async def aadd(self, client_key, timestamp, nonce, timeout):
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(self.add)(client_key, timestamp, nonce, timeout)
+
+
+class DatabaseNonceStore(NonceStore):
+    """
+    Stores nonces in the Nonce table of social_django.
+    The Nonce has a unique_together on all its fields and should raise when the Nonce was created before.
+    As fallback there is also the created variable which should always be True.
+    The table keeps growing, so use the prune_lti_nonces command to remove nonces that can't be replayed anymore.
+    """
+
+    def add(self, client_key, timestamp, nonce, timeout):
+        from social_django.models import Nonce
+        try:
+            nonce, created = Nonce.objects.get_or_create(timestamp=timestamp, salt=nonce, server_url=client_key)
+        except (ValidationError, IntegrityError, DataError):  # DataError for nonces that don't fit the table
+            return False
+        return created
+
+    @staticmethod
+    def prune(before, client_keys=None):
+        """
+        Deletes nonces with a timestamp before the given UNIX time and returns the number of deleted nonces.
+        """
+        from social_django.models import Nonce
+        queryset = Nonce.objects.filter(timestamp__lt=before)
+        if client_keys is not None:
+            queryset = queryset.filter(server_url__in=[str(client_key) for client_key in client_keys])
+        count, deleted = queryset.delete()
+        return count
+
+
+class CacheNonceStore(NonceStore):
+    """
+    Stores nonces in a Django cache, which expires them automatically.
+    Cache.add is atomic for cache backends that can be shared between processes like Redis or Memcached.
+    """
+
+    def __init__(self, alias=None):
+        self.alias = alias or getattr(settings, "IMS_NONCE_CACHE", "default")
+
+    def add(self, client_key, timestamp, nonce, timeout):
+        key = "ims:lti:nonce:{}:{}:{}".format(client_key, timestamp, nonce)
+        return caches[self.alias].add(key, 1, timeout)
+
+
+class MemoryNonceStore(NonceStore):
+    """
+    Stores nonces inside the current process. Only use this for tests and benchmarks,
+    because other processes will accept nonces that this process has seen.
+    """
+
+    SWEEP_INTERVAL = 60
+
+    def __init__(self):
+        self.nonces = {}
+        self.lock = Lock()
+        self.swept_at = time()
+
+    def add(self, client_key, timestamp, nonce, timeout):
+        key = (client_key, timestamp, nonce,)
+        now = time()
+        with self.lock:
+            if now - self.swept_at > self.SWEEP_INTERVAL:
+                self.nonces = {key: expires_at for key, expires_at in self.nonces.items() if expires_at > now}
+                self.swept_at = now
+            expires_at = self.nonces.get(key, None)
+            if expires_at is not None and expires_at > now:
+                return False
+            self.nonces[key] = now + timeout
+            return True
+
+    async def aadd(self, client_key, timestamp, nonce, timeout):
+        return self.add(client_key, timestamp, nonce, timeout)
+
+    def clear(self):
+        with self.lock:
+            self.nonces = {}
+
+
+@lru_cache(maxsize=None)
+def get_nonce_store():
+    """
+    Returns an instance of the store set by the IMS_NONCE_STORE setting, which defaults to the DatabaseNonceStore.
+    """
+    store = getattr(settings, "IMS_NONCE_STORE", "ims.authorization.nonces.DatabaseNonceStore")
+    return import_string(store)()
@@ -1,10 +1,17 @@
-from oauthlib.oauth1 import RequestValidator
+from time import time
+from datetime import timedelta
 
+from oauthlib.oauth1 import RequestValidator, SignatureOnlyEndpoint
+from oauthlib.oauth1.rfc5849.errors import OAuth1Error
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import RemoteUserBackend
-from django.core.exceptions import ValidationError
-from social_django.models import Nonce
+from django.contrib.auth.models import update_last_login as django_update_last_login
+from django.utils import timezone
 
 from ims.models import LTITenant
+from ims.authorization.nonces import get_nonce_store
 
 
 class LTIRequestValidator(RequestValidator):
@@ -12,8 +19,26 @@ class LTIRequestValidator(RequestValidator):
     A RequestValidator to validate the launch of a token.
     The security of this RequestValidator is low and should not be used for normal OAuth flows.
     Review the validate_timestamp_and_nonce method for more information on the weaknesses in security of LTI.
+    Tenants are looked up through the LTI cache and memoized on the validator,
+    which means a validator should only be used for a single request.
     """
 
+    def __init__(self):
+        super().__init__()
+        self.tenants = {}
+        self.nonces = {}
+
+    def get_tenant(self, client_key):
+        """
+        Returns the LTITenant for the client key or None if it does not exist.
+        """
+        if client_key not in self.tenants:
+            try:
+                self.tenants[client_key] = LTITenant.objects.get_cached(client_key)
+            except LTITenant.DoesNotExist:
+                self.tenants[client_key] = None
+        return self.tenants[client_key]
+
     @property
     def client_key_length(self):
         return 20, 36  # adjusted to accept UUID
@@ -25,40 +50,131 @@ class LTIRequestValidator(RequestValidator):
         return safe_characters
 
     def get_client_secret(self, client_key, request):
-        credentials = LTITenant.objects.get(client_key=client_key)
+        credentials = self.get_tenant(client_key)
+        if credentials is None:
+            raise LTITenant.DoesNotExist("No tenant with client key {}".format(client_key))
         return credentials.client_secret
 
     def validate_client_key(self, client_key, request):
-        try:
-            LTITenant.objects.get(client_key=client_key)
-            return True
-        except LTITenant.DoesNotExist:
-            return False
+        return self.get_tenant(client_key) is not None
 
     @property
     def nonce_length(self):
         return 20, 42
 
+    @property
+    def timestamp_lifetime(self):
+        return getattr(settings, "IMS_LTI_TIMESTAMP_LIFETIME", 600)
+
+    def get_nonce_timeout(self, timestamp):
+        """
+        Returns the number of seconds that a nonce with the given timestamp should be remembered,
+        or None when the timestamp is outside of the timestamp lifetime.
+        """
+        try:
+            timestamp = int(timestamp)
+        except (TypeError, ValueError):
+            return None
+        age = time() - timestamp
+        if abs(age) > self.timestamp_lifetime:
+            return None
+        return int(self.timestamp_lifetime - age) + 1
+
     def validate_timestamp_and_nonce(self, client_key, timestamp, nonce,
                                      request, request_token=None, access_token=None):
         """
-        To prevent replay attacks we need to check whether the nonce has not been used before for client and time
-        The Nonce has a unique_together on all its fields and should raise when the Nonce was created before
-        As fallback there is also the created variable which should always be True
+        To prevent replay attacks we need to check whether the nonce has not been used before for client and time.
+        Requests with a timestamp outside of the timestamp lifetime get rejected without touching the nonce store.
+        Other nonces are kept by the nonce store until their timestamp expires.
         """
+        validated = self.nonces.pop((client_key, timestamp, nonce,), None)
+        if validated is not None:
+            return validated
+        timeout = self.get_nonce_timeout(timestamp)
+        if timeout is None:
+            return False
+        return get_nonce_store().add(client_key, int(timestamp), nonce, timeout)
+
+    async def avalidate_timestamp_and_nonce(self, client_key, timestamp, nonce):
+        timeout = self.get_nonce_timeout(timestamp)
+        if timeout is None:
+            return False
+        return await get_nonce_store().aadd(client_key, int(timestamp), nonce, timeout)
+
+    async def ais_valid_request(self, tool_provider):
+        """
+        Validates a launch without blocking the event loop.
+        The tenant and nonce get validated upfront, after which the validation by oauthlib
+        only uses results that are memoized on the validator and doesn't perform any I/O.
+        Just like oauthlib does, transport security and the format of mandatory parameters get checked
+        before the nonce gets stored, to keep requests that are rejected anyway out of the nonce store.
+        """
+        from asgiref.sync import sync_to_async
+        endpoint = SignatureOnlyEndpoint(self)
         try:
-            nonce, created = Nonce.objects.get_or_create(timestamp=timestamp, salt=nonce, server_url=client_key)
-        except ValidationError:
+            request = endpoint._create_request(
+                tool_provider.launch_url, "POST", tool_provider.to_params(), tool_provider.launch_headers
+            )
+            endpoint._check_transport_security(request)
+            endpoint._check_mandatory_parameters(request)
+        except OAuth1Error:
             return False
-        return created
+        await sync_to_async(self.get_tenant)(request.client_key)
+        self.nonces[(request.client_key, request.timestamp, request.nonce,)] = \
+            await self.avalidate_timestamp_and_nonce(request.client_key, request.timestamp, request.nonce)
+        return tool_provider.is_valid_request(self)
 
 
 class LTIRemoteUserBackend(RemoteUserBackend):
+    """
+    Gets or creates users based on the email address of a launch in a single query.
+    Just like the RemoteUserBackend unknown users only get created when create_unknown_user is True
+    and new users get passed to configure_user.
+    New users get their names from the launch upon creation and existing users only get written to
+    when the launch provides a name that the user is missing. Launches without names never cause a write.
+    """
+
+    @staticmethod
+    def get_launch_names(request):
+        return {
+            "first_name": request.POST.get('lis_person_name_given', ''),
+            "last_name": request.POST.get('lis_person_name_family', '')
+        }
 
     def authenticate(self, request, remote_user):
-        user = super().authenticate(request, remote_user)
-        if not user.first_name or not user.last_name:  # because RemoteUserBackend.configure_user ignores request :(
-            user.first_name = request.POST.get('lis_person_name_given', '')
-            user.last_name = request.POST.get('lis_person_name_family', '')
-            user.save()
-        return user
+        if not remote_user:
+            return None
+        UserModel = get_user_model()
+        names = self.get_launch_names(request)
+        username = self.clean_username(remote_user)
+        if self.create_unknown_user:
+            user, created = UserModel._default_manager.get_or_create(
+                defaults=names,
+                **{UserModel.USERNAME_FIELD: username}
+            )
+        else:
+            try:
+                user = UserModel._default_manager.get_by_natural_key(username)
+            except UserModel.DoesNotExist:
+                return None
+            created = False
+        if created:
+            user = self.configure_user(request, user)
+        else:
+            changed = [field for field, value in names.items() if value and not getattr(user, field)]
+            for field in changed:
+                setattr(user, field, names[field])
+            if changed:
+                user.save(update_fields=changed)
+        return user if self.user_can_authenticate(user) else None
+
+
+def update_last_login(sender, user, **kwargs):
+    """
+    Replaces the user_logged_in receiver of Django when IMS_LAST_LOGIN_THROTTLE is set to a number of seconds.
+    The last_login of a user only gets written when it is older than the throttle.
+    """
+    throttle = getattr(settings, "IMS_LAST_LOGIN_THROTTLE", None)
+    if throttle and user.last_login and timezone.now() - user.last_login < timedelta(seconds=throttle):
+        return
+    django_update_last_login(sender, user, **kwargs)
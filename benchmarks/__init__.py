@@ -0,0 +1 @@
+from ims.benchmarks.launches import LaunchBenchmark, LaunchScenario, SCENARIOS
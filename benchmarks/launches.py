@@ -0,0 +1,278 @@
+import sys
+import math
+import asyncio
+from time import perf_counter
+from datetime import datetime
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.contrib.auth import get_user_model
+
+from lti import ToolConsumer
+
+from ims.models import LTIApp, LTITenant, LTIPrivacyLevels
+from ims.models.lti import (LearningManagementSystems, get_lti_cache, get_app_cache_key, get_tenant_cache_key,
+                            get_config_version_key)
+from ims.dispatch import launch_dispatcher
+from ims.authorization import get_nonce_store
+
+
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+
+class LaunchScenario(object):
+    """
+    Describes the launches of a benchmark run.
+    Warm scenarios keep caches between launches, while cold scenarios clear the cached tenant, app and view
+    before every launch.
+    """
+
+    def __init__(self, name, privacy_level, lms, warm=True):
+        self.name = name
+        self.privacy_level = privacy_level
+        self.lms = lms
+        self.warm = warm
+
+    def __repr__(self):
+        return "<LaunchScenario {}>".format(self.name)
+
+
+SCENARIOS = [
+    LaunchScenario("warm-public-canvas", LTIPrivacyLevels.PUBLIC, LearningManagementSystems.CANVAS),
+    LaunchScenario("warm-public-generic", LTIPrivacyLevels.PUBLIC, LearningManagementSystems.MOODLE),
+    LaunchScenario("warm-anonymous-canvas", LTIPrivacyLevels.ANONYMOUS, LearningManagementSystems.CANVAS),
+    LaunchScenario("warm-anonymous-generic", LTIPrivacyLevels.ANONYMOUS, LearningManagementSystems.MOODLE),
+    LaunchScenario("cold-public-canvas", LTIPrivacyLevels.PUBLIC, LearningManagementSystems.CANVAS, warm=False),
+    LaunchScenario("cold-anonymous-generic", LTIPrivacyLevels.ANONYMOUS, LearningManagementSystems.MOODLE,
+                   warm=False),
+]
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest rank percentile of values or None when there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(percent / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class QueryCounter(object):
+    """
+    Counts queries through a database execute wrapper, which is cheaper than capturing queries.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class LaunchBenchmark(object):
+    """
+    Launches LTI apps with validly signed launch requests for a number of generated tenants.
+    Launches go through the Django test client, or through the async test client when asynchronous is True,
+    using the URL patterns of ims.benchmarks.urls. Apps, tenants, users and nonces that the benchmark creates
+    get deleted after every scenario.
+    Queries per launch are only counted for synchronous launches,
+    because asynchronous launches query the database from other threads.
+    """
+
+    SLUG_PREFIX = "ims-benchmark"
+    USERNAME_TEMPLATE = "ims-benchmark-{}@example.com"
+
+    def __init__(self, tenants=10, launches=200, users=20, warmup=10, asynchronous=False,
+                 nonce_store="ims.authorization.MemoryNonceStore"):
+        self.tenants = tenants
+        self.launches = launches
+        self.users = users
+        self.warmup = warmup
+        self.asynchronous = asynchronous
+        self.nonce_store = nonce_store
+
+    def get_launch_path(self, app):
+        return "/async/{}/".format(app.slug) if self.asynchronous else "/{}/".format(app.slug)
+
+    def get_launch_data(self, app, tenant, user_index):
+        params = {
+            "lti_message_type": "basic-lti-launch-request",
+            "lti_version": "LTI-1p0",
+            "resource_link_id": "ims-benchmark-resource",
+            "roles": "Learner",
+            "lis_person_contact_email_primary": self.USERNAME_TEMPLATE.format(user_index),
+            "lis_person_name_given": "Benchmark",
+            "lis_person_name_family": "User {}".format(user_index),
+            "custom_canvas_course_id": "1",
+            "custom_canvas_api_domain": "canvas.example.com",
+        }
+        consumer = ToolConsumer(
+            consumer_key=str(tenant.client_key),
+            consumer_secret=tenant.client_secret,
+            launch_url="https://testserver{}".format(self.get_launch_path(app)),
+            params=params
+        )
+        return urlencode(consumer.generate_launch_data())
+
+    def create_fixtures(self, scenario):
+        app = LTIApp.objects.create(
+            slug="{}-{}".format(self.SLUG_PREFIX, scenario.name),
+            view="ims-benchmark-target",
+            title="Benchmark {}".format(scenario.name),
+            description="Created by the LTI launch benchmark",
+            privacy_level=scenario.privacy_level
+        )
+        tenants = [
+            LTITenant.objects.create(
+                app=app,
+                organization="Benchmark organization {}".format(index),
+                slug="benchmark-{}".format(index),
+                lms=scenario.lms
+            )
+            for index in range(self.tenants)
+        ]
+        return app, tenants
+
+    def delete_fixtures(self, app, tenants):
+        from social_django.models import Nonce
+        Nonce.objects.filter(server_url__in=[str(tenant.client_key) for tenant in tenants]).delete()
+        get_user_model().objects.filter(username__in=[
+            self.USERNAME_TEMPLATE.format(index) for index in range(self.users)
+        ]).delete()
+        app.delete()  # also deletes the tenants and removes them from the LTI cache
+
+    @staticmethod
+    def clear_caches(app, tenant):
+        get_lti_cache().delete_many([
+            get_app_cache_key(app.slug),
+            get_tenant_cache_key(tenant.client_key),
+            get_config_version_key(app.slug)
+        ])
+        launch_dispatcher.discard(app.slug)
+
+    def iter_launches(self, scenario, app, tenants):
+        """
+        Yields the tenant, user index and signed data for every launch including warmup launches.
+        Signing happens lazily, so that timestamps are fresh for long runs.
+        """
+        for index in range(self.warmup + self.launches):
+            tenant = tenants[index % len(tenants)]
+            user_index = index % self.users
+            yield index, tenant, user_index, self.get_launch_data(app, tenant, user_index)
+
+    def run_sync_launches(self, scenario, app, tenants):
+        clients = [Client() for _ in range(self.users)]
+        counter = QueryCounter()
+        measurements = []
+        path = self.get_launch_path(app)
+        for index, tenant, user_index, data in self.iter_launches(scenario, app, tenants):
+            if not scenario.warm:
+                self.clear_caches(app, tenant)
+            counter.count = 0
+            with connection.execute_wrapper(counter):
+                start = perf_counter()
+                response = clients[user_index].post(path, data, content_type=FORM_CONTENT_TYPE, secure=True)
+                duration = perf_counter() - start
+            if index >= self.warmup:
+                measurements.append((duration, counter.count, response.status_code,))
+        return measurements
+
+    async def run_async_launches(self, scenario, app, tenants):
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+        clients = [AsyncClient() for _ in range(self.users)]
+        measurements = []
+        path = self.get_launch_path(app)
+        for index, tenant, user_index, data in self.iter_launches(scenario, app, tenants):
+            if not scenario.warm:
+                await sync_to_async(self.clear_caches)(app, tenant)
+            start = perf_counter()
+            response = await clients[user_index].post(path, data, content_type=FORM_CONTENT_TYPE, secure=True)
+            duration = perf_counter() - start
+            if index >= self.warmup:
+                measurements.append((duration, None, response.status_code,))
+        return measurements
+
+    @staticmethod
+    def summarize(scenario, measurements):
+        durations = [duration for duration, queries, status in measurements]
+        queries = [queries for duration, queries, status in measurements if queries is not None]
+        total = sum(durations)
+        milliseconds = [duration * 1000 for duration in durations]
+        return {
+            "name": scenario.name,
+            "privacy_level": scenario.privacy_level,
+            "lms": scenario.lms,
+            "warm": scenario.warm,
+            "launches": len(measurements),
+            "errors": len([status for duration, queries, status in measurements if status != 200]),
+            "duration": total,
+            "throughput": len(measurements) / total if total else None,
+            "latency_ms": {
+                "mean": sum(milliseconds) / len(milliseconds) if milliseconds else None,
+                "p50": percentile(milliseconds, 50),
+                "p95": percentile(milliseconds, 95),
+                "p99": percentile(milliseconds, 99),
+                "max": max(milliseconds) if milliseconds else None,
+            },
+            "queries": {
+                "mean": sum(queries) / len(queries) if queries else None,
+                "max": max(queries) if queries else None,
+            }
+        }
+
+    def run_scenario(self, scenario):
+        app, tenants = self.create_fixtures(scenario)
+        try:
+            if self.asynchronous:
+                measurements = asyncio.run(self.run_async_launches(scenario, app, tenants))
+            else:
+                measurements = self.run_sync_launches(scenario, app, tenants)
+        finally:
+            self.delete_fixtures(app, tenants)
+        return self.summarize(scenario, measurements)
+
+    def run(self, scenarios=None, progress=None):
+        """
+        Runs the scenarios and returns the results as a JSON serializable dictionary.
+        The progress callable gets called with the summary of every scenario.
+        """
+        scenarios = SCENARIOS if scenarios is None else scenarios
+        overrides = {
+            "ROOT_URLCONF": "ims.benchmarks.urls",
+            "ALLOWED_HOSTS": list(settings.ALLOWED_HOSTS) + ["testserver"],
+            "IMS_NONCE_STORE": self.nonce_store,
+        }
+        results = []
+        with override_settings(**overrides):
+            get_nonce_store.cache_clear()
+            try:
+                for scenario in scenarios:
+                    summary = self.run_scenario(scenario)
+                    results.append(summary)
+                    if progress is not None:
+                        progress(summary)
+            finally:
+                get_nonce_store.cache_clear()
+        return {
+            "version": 1,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "python": sys.version.split()[0],
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "mode": "asgi" if self.asynchronous else "wsgi",
+            "nonce_store": self.nonce_store,
+            "parameters": {
+                "tenants": self.tenants,
+                "launches": self.launches,
+                "users": self.users,
+                "warmup": self.warmup,
+            },
+            "scenarios": results
+        }
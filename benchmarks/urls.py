@@ -0,0 +1,17 @@
+from django.conf.urls import url
+from django.http import HttpResponse
+
+from ims import views as ims_views
+
+
+def benchmark_target(request):
+    return HttpResponse("ok")
+
+
+urlpatterns = [
+    url(r'^target/$', benchmark_target, name='ims-benchmark-target'),
+    url(r'^(?P<app_slug>[A-Za-z0-9\-]+)/config/(?P<tenant_slug>[A-Za-z0-9\-]+)\.xml$', ims_views.lti_config,
+        name='lti-config'),
+    url(r'^async/(?P<slug>[A-Za-z0-9\-]+)/?$', getattr(ims_views, "async_lti_launch", ims_views.lti_launch)),
+    url(r'^(?P<slug>[A-Za-z0-9\-]+)/?$', ims_views.lti_launch),
+]
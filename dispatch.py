@@ -0,0 +1,75 @@
+from threading import Lock
+
+from django.urls import reverse, resolve, get_resolver, get_urlconf
+
+try:
+    from asgiref.sync import iscoroutinefunction  # also recognizes views that Django marks as coroutines
+except ImportError:
+    from asyncio import iscoroutinefunction
+
+
+def resolve_view(view_name):
+    """
+    Returns the ResolverMatch for a named view that doesn't take any arguments.
+    Raises NoReverseMatch when the view name is unknown.
+    """
+    return resolve(reverse(view_name))
+
+
+class LaunchDispatcher(object):
+    """
+    Maps LTIApp slugs to the views that the apps launch, so launches don't have to walk the URL resolver.
+    Views get resolved upon first launch of an app and whenever the view of an app or the URLconf changes.
+    Every process has its own dispatcher, which is why an app view gets checked against the resolved view name
+    instead of relying on LTIApp signals from other processes.
+    """
+
+    def __init__(self):
+        self.resolver = None
+        self.matches = {}
+        self.lock = Lock()
+
+    def get_match(self, app):
+        resolver = get_resolver(get_urlconf())
+        with self.lock:
+            if resolver is not self.resolver:
+                self.resolver = resolver
+                self.matches = {}
+            entry = self.matches.get(app.slug, None)
+        if entry is None or entry[0] != app.view:
+            entry = (app.view, resolve_view(app.view),)
+            with self.lock:
+                if resolver is self.resolver:
+                    self.matches[app.slug] = entry
+        return entry[1]
+
+    def refresh(self, app):
+        self.discard(app.slug)
+        return self.get_match(app)
+
+    def discard(self, slug):
+        with self.lock:
+            self.matches.pop(slug, None)
+
+    def dispatch(self, request, app):
+        """
+        Returns the response of the view of the LTIApp for the given request.
+        """
+        match = self.get_match(app)
+        if iscoroutinefunction(match.func):
+            from asgiref.sync import async_to_sync
+            return async_to_sync(match.func)(request, *match.args, **match.kwargs)
+        return match.func(request, *match.args, **match.kwargs)
+
+    async def adispatch(self, request, app):
+        """
+        Returns the response of the view of the LTIApp for the given request from within an async view.
+        """
+        from asgiref.sync import sync_to_async
+        match = self.get_match(app)
+        if iscoroutinefunction(match.func):
+            return await match.func(request, *match.args, **match.kwargs)
+        return await sync_to_async(match.func)(request, *match.args, **match.kwargs)
+
+
+launch_dispatcher = LaunchDispatcher()
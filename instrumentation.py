@@ -0,0 +1,220 @@
+import logging
+from time import perf_counter
+from bisect import bisect_left
+from threading import Lock
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger("ims.launches")
+
+
+# Sent after every instrumented launch with request, response and phases as arguments.
+# Phases is a list of (name, seconds, queries) tuples in the order that the phases ran.
+# Queries is None for phases that didn't count queries.
+launch_timed = Signal()
+
+
+class NullPhase(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class NullLaunchTimer(object):
+    """
+    Stands in for a LaunchTimer when instrumentation is disabled, which keeps the overhead to a method call per phase.
+    """
+
+    null_phase = NullPhase()
+
+    def phase(self, name, queries=True):
+        return self.null_phase
+
+    def finish(self, request, response):
+        return response
+
+
+class QueryCounter(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class LaunchPhase(object):
+    """
+    Times a phase and counts the queries that the current thread makes during the phase.
+    Phases that hand work to other threads should not count queries, in which case queries get reported as None.
+    """
+
+    def __init__(self, timer, name, queries=True):
+        self.timer = timer
+        self.name = name
+        self.counter = QueryCounter() if queries else None
+        self.wrapper = connection.execute_wrapper(self.counter) if queries else None
+        self.start = None
+
+    def __enter__(self):
+        if self.wrapper is not None:
+            self.wrapper.__enter__()
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = perf_counter() - self.start
+        if self.wrapper is not None:
+            self.wrapper.__exit__(exc_type, exc_val, exc_tb)
+        queries = self.counter.count if self.counter is not None else None
+        self.timer.phases.append((self.name, duration, queries,))
+        return False
+
+
+class LaunchTimer(object):
+    """
+    Records the duration and number of queries of every phase of a launch.
+    Once the launch finishes the phases get sent to the launch_timed signal and the sinks of IMS_LAUNCH_METRICS_SINKS.
+    When IMS_LAUNCH_SERVER_TIMING is True the phases get added to the response as a Server-Timing header.
+    """
+
+    def __init__(self):
+        self.phases = []
+
+    def phase(self, name, queries=True):
+        return LaunchPhase(self, name, queries=queries)
+
+    def get_server_timing(self):
+        metrics = []
+        for name, duration, queries in self.phases:
+            metric = "{};dur={:.2f}".format(name, duration * 1000)
+            if queries is not None:
+                metric += ';desc="{} queries"'.format(queries)
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+    def finish(self, request, response):
+        if getattr(settings, "IMS_LAUNCH_SERVER_TIMING", False):
+            response["Server-Timing"] = self.get_server_timing()
+        launch_timed.send(sender=self.__class__, request=request, response=response, phases=self.phases)
+        for sink in get_metrics_sinks():
+            sink(request, response, self.phases)
+        return response
+
+
+null_launch_timer = NullLaunchTimer()
+
+
+def get_launch_timer():
+    if getattr(settings, "IMS_LAUNCH_INSTRUMENTATION", False):
+        return LaunchTimer()
+    return null_launch_timer
+
+
+@lru_cache(maxsize=None)
+def get_metrics_sinks():
+    return [import_string(sink) for sink in getattr(settings, "IMS_LAUNCH_METRICS_SINKS", [])]
+
+
+class PhaseHistogram(object):
+    """
+    A metrics sink that aggregates launch phases into histograms with fixed buckets in seconds.
+    The histograms can be logged through snapshot or scraped in the Prometheus text format.
+    """
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = Lock()
+        self.phases = {}
+
+    def __call__(self, request, response, phases):
+        with self.lock:
+            total = 0.0
+            total_queries = 0
+            for name, duration, queries in phases:
+                self.observe(name, duration, queries)
+                total += duration
+                total_queries += queries or 0
+            self.observe("total", total, total_queries)
+
+    def observe(self, name, duration, queries):
+        phase = self.phases.get(name, None)
+        if phase is None:
+            phase = self.phases[name] = {
+                "count": 0,
+                "sum": 0.0,
+                "queries": 0,
+                "buckets": [0] * (len(self.buckets) + 1)
+            }
+        phase["count"] += 1
+        phase["sum"] += duration
+        phase["queries"] += queries or 0
+        phase["buckets"][bisect_left(self.buckets, duration)] += 1
+
+    def snapshot(self):
+        """
+        Returns the count, sum of durations, sum of queries and cumulative bucket counts per phase.
+        """
+        with self.lock:
+            snapshot = {}
+            for name, phase in self.phases.items():
+                cumulative = []
+                count = 0
+                for bucket_count in phase["buckets"]:
+                    count += bucket_count
+                    cumulative.append(count)
+                snapshot[name] = {
+                    "count": phase["count"],
+                    "sum": phase["sum"],
+                    "queries": phase["queries"],
+                    "buckets": list(zip(self.buckets + (float("inf"),), cumulative))
+                }
+            return snapshot
+
+    def reset(self):
+        with self.lock:
+            self.phases = {}
+
+    def to_prometheus(self, metric="ims_lti_launch_phase"):
+        lines = [
+            "# TYPE {}_seconds histogram".format(metric),
+        ]
+        snapshot = self.snapshot()
+        for name, phase in sorted(snapshot.items()):
+            for bound, count in phase["buckets"]:
+                bound = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append('{}_seconds_bucket{{phase="{}",le="{}"}} {}'.format(metric, name, bound, count))
+            lines.append('{}_seconds_sum{{phase="{}"}} {}'.format(metric, name, phase["sum"]))
+            lines.append('{}_seconds_count{{phase="{}"}} {}'.format(metric, name, phase["count"]))
+        lines.append("# TYPE {}_queries counter".format(metric))
+        for name, phase in sorted(snapshot.items()):
+            lines.append('{}_queries{{phase="{}"}} {}'.format(metric, name, phase["queries"]))
+        return "\n".join(lines) + "\n"
+
+
+launch_histogram = PhaseHistogram()
+
+
+def log_launch_phases(request, response, phases):
+    """
+    A metrics sink that logs the phases of every launch to the ims.launches logger.
+    """
+    logger.info(
+        "LTI launch %s %s: %s",
+        request.path, response.status_code,
+        ", ".join(
+            "{} {:.2f}ms {}q".format(name, duration * 1000, "-" if queries is None else queries)
+            for name, duration, queries in phases
+        )
+    )
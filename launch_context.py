@@ -0,0 +1,200 @@
+from django.conf import settings
+from django.core import signing
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+
+class LaunchContext(object):
+    """
+    Holds the information of a launch that app views read from the session.
+    Contexts get encoded as a compact signed list that starts with the version of the encoding,
+    which allows contexts to travel in a cookie instead of the session.
+    """
+
+    VERSION = 2
+    SALT = "ims.launch_context"
+    SESSION_KEYS = ("tenant_key", "roles", "api_domain", "course_id", "outcome_service_url", "result_sourcedid",)
+
+    __slots__ = SESSION_KEYS
+
+    def __init__(self, tenant_key, roles="", api_domain=None, course_id=None, outcome_service_url=None,
+                 result_sourcedid=None):
+        self.tenant_key = tenant_key
+        self.roles = roles
+        self.api_domain = api_domain
+        self.course_id = course_id
+        self.outcome_service_url = outcome_service_url
+        self.result_sourcedid = result_sourcedid
+
+    def __eq__(self, other):
+        if not isinstance(other, LaunchContext):
+            return NotImplemented
+        return self.to_list() == other.to_list()
+
+    def __repr__(self):
+        return "<LaunchContext {}>".format(self.tenant_key)
+
+    def to_list(self):
+        return [getattr(self, key) for key in self.SESSION_KEYS]
+
+    def copy(self):
+        return LaunchContext(*self.to_list())
+
+    def encode(self):
+        return signing.dumps([self.VERSION] + self.to_list(), salt=self.SALT, compress=True)
+
+    @classmethod
+    def decode(cls, value, max_age=None):
+        """
+        Returns the context of an encoded value or None when the value is invalid, expired or of another version.
+        """
+        try:
+            values = signing.loads(value, salt=cls.SALT, max_age=max_age)
+        except signing.BadSignature:
+            return None
+        if not isinstance(values, list) or len(values) != len(cls.SESSION_KEYS) + 1 or values[0] != cls.VERSION:
+            return None
+        return cls(*values[1:])
+
+    @classmethod
+    def from_session(cls, session):
+        if "tenant_key" not in session:
+            return None
+        return cls(*[session.get(key, None) for key in cls.SESSION_KEYS])
+
+    def to_session(self, session):
+        """
+        Writes the context to the session keys, but only the keys that change.
+        Sessions don't get saved when nothing changes, which saves a write for repeated launches.
+        """
+        for key in self.SESSION_KEYS:
+            value = getattr(self, key)
+            if key not in session or session[key] != value:
+                session[key] = value
+
+
+class LaunchSessionProxy(object):
+    """
+    Wraps a session to serve the session keys of a launch from the LaunchContext of the request.
+    Other keys and methods go to the actual session, which only loads and saves when it gets used.
+    Launch keys are not part of the keys, values and items of the session.
+    """
+
+    def __init__(self, request, session):
+        self.request = request
+        self.session = session
+
+    @property
+    def context(self):
+        return getattr(self.request, "lti_context", None)
+
+    def is_launch_key(self, key):
+        return key in LaunchContext.SESSION_KEYS and self.context is not None
+
+    def __getitem__(self, key):
+        if self.is_launch_key(key):
+            return getattr(self.context, key)
+        return self.session[key]
+
+    def __setitem__(self, key, value):
+        if self.is_launch_key(key):
+            setattr(self.context, key, value)
+        else:
+            self.session[key] = value
+
+    def __delitem__(self, key):
+        if self.is_launch_key(key):
+            setattr(self.context, key, None)
+        else:
+            del self.session[key]
+
+    def __contains__(self, key):
+        return self.is_launch_key(key) or key in self.session
+
+    def get(self, key, default=None):
+        if self.is_launch_key(key):
+            return getattr(self.context, key)
+        return self.session.get(key, default)
+
+    def pop(self, key, *args):
+        if self.is_launch_key(key):
+            value = getattr(self.context, key)
+            setattr(self.context, key, None)
+            return value
+        return self.session.pop(key, *args)
+
+    def setdefault(self, key, value):
+        if self.is_launch_key(key):
+            return getattr(self.context, key)
+        return self.session.setdefault(key, value)
+
+    def flush(self):
+        self.request.lti_context = None
+        self.session.flush()
+
+    def __getattr__(self, attr):
+        return getattr(self.session, attr)
+
+
+def get_launch_context_storage():
+    return getattr(settings, "IMS_LAUNCH_CONTEXT_STORAGE", "session")
+
+
+def start_launch_context(request, context):
+    """
+    Makes the context available as request.lti_context and through the session keys of request.session.
+    When IMS_LAUNCH_CONTEXT_STORAGE is "cookie" the session doesn't get written to
+    and the LaunchContextMiddleware stores the context in a signed cookie instead.
+    """
+    request.lti_context = context
+    if get_launch_context_storage() != "cookie":
+        context.to_session(request.session)
+    elif not isinstance(request.session, LaunchSessionProxy):
+        request.session = LaunchSessionProxy(request, request.session)
+
+
+class LaunchContextMiddleware(MiddlewareMixin):
+    """
+    Reads and writes the LaunchContext cookie when IMS_LAUNCH_CONTEXT_STORAGE is "cookie".
+    Place this middleware after the SessionMiddleware.
+    """
+
+    def get_cookie_name(self):
+        return getattr(settings, "IMS_LAUNCH_CONTEXT_COOKIE", "ims_lti_context")
+
+    def process_request(self, request):
+        request.lti_context = None
+        request._lti_context_cookie = None
+        if get_launch_context_storage() != "cookie":
+            return
+        value = request.COOKIES.get(self.get_cookie_name(), None)
+        if value:
+            request._lti_context_cookie = LaunchContext.decode(value, max_age=settings.SESSION_COOKIE_AGE)
+        if request._lti_context_cookie is not None:
+            request.lti_context = request._lti_context_cookie.copy()
+            request.session = LaunchSessionProxy(request, request.session)
+
+    def process_response(self, request, response):
+        if get_launch_context_storage() != "cookie":
+            return response
+        context = getattr(request, "lti_context", None)
+        cookie = getattr(request, "_lti_context_cookie", None)
+        cookie_name = self.get_cookie_name()
+        if context is not None:
+            patch_vary_headers(response, ("Cookie",))
+        if context is not None and context != cookie:
+            cookie_settings = {
+                "max_age": settings.SESSION_COOKIE_AGE,
+                "domain": settings.SESSION_COOKIE_DOMAIN,
+                "path": settings.SESSION_COOKIE_PATH,
+                "secure": settings.SESSION_COOKIE_SECURE,
+                "httponly": True,
+            }
+            samesite = getattr(settings, "SESSION_COOKIE_SAMESITE", None)
+            if samesite:
+                cookie_settings["samesite"] = samesite
+            response.set_cookie(cookie_name, context.encode(), **cookie_settings)
+        elif context is None and cookie_name in request.COOKIES:
+            response.delete_cookie(cookie_name, path=settings.SESSION_COOKIE_PATH,
+                                   domain=settings.SESSION_COOKIE_DOMAIN)
+        return response
@@ -0,0 +1,3 @@
+from ims.lms.client import (LMSClient, CanvasClient, LMSAPIError, TenantConnections, tenant_connections,
+                            get_lms_client, get_request_lms_client)
+from ims.lms.outcomes import OutcomeSender, submit_score
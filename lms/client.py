@@ -0,0 +1,242 @@
+from time import time
+from hashlib import md5
+from uuid import uuid4
+from threading import Lock, BoundedSemaphore
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.core.cache import caches
+
+from ims.models import LTITenant
+from ims.models.lti import LearningManagementSystems
+from ims.launch_context import LaunchContext
+
+
+class LMSAPIError(Exception):
+
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+    @property
+    def status_code(self):
+        return self.response.status_code if self.response is not None else None
+
+
+def get_lms_cache():
+    return caches[getattr(settings, "IMS_LMS_CACHE", "default")]
+
+
+def get_course_version_key(client_key, course_id):
+    return "ims:lms:version:{}:{}".format(client_key, course_id or "-")
+
+
+class TenantConnections(object):
+    """
+    Keeps a requests Session per tenant, which pools keep-alive connections to the LMS of that tenant,
+    together with a semaphore that limits the number of concurrent requests per tenant.
+    The limit comes from IMS_LMS_CONCURRENCY and is read when the first client for a tenant gets created.
+    """
+
+    def __init__(self):
+        self.connections = {}
+        self.lock = Lock()
+
+    def get(self, client_key):
+        with self.lock:
+            connection = self.connections.get(client_key, None)
+            if connection is None:
+                limit = getattr(settings, "IMS_LMS_CONCURRENCY", 10)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=limit)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                connection = self.connections[client_key] = (session, BoundedSemaphore(limit),)
+            return connection
+
+    def close(self, client_key=None):
+        with self.lock:
+            client_keys = list(self.connections.keys()) if client_key is None else [client_key]
+            for key in client_keys:
+                connection = self.connections.pop(key, None)
+                if connection is not None:
+                    connection[0].close()
+
+
+tenant_connections = TenantConnections()
+
+
+class LMSClient(object):
+    """
+    Calls the API of the LMS of a tenant with the api_secret of the tenant as Bearer token.
+    The API lives under the api_domain of a launch or otherwise under the lms_domain of the tenant.
+    GET responses get cached per tenant and course. Cached responses are used as is for IMS_LMS_CACHE_TTL seconds,
+    after which they get revalidated with their ETag until they expire after IMS_LMS_CACHE_TIMEOUT seconds.
+    """
+
+    API_PREFIX = ""
+
+    def __init__(self, tenant, api_domain=None, course_id=None, base_url=None, timeout=None):
+        self.tenant = tenant
+        self.client_key = str(tenant.client_key)
+        self.course_id = course_id
+        if base_url is None:
+            base_url = "https://{}".format(api_domain) if api_domain else tenant.lms_domain
+        if not base_url:
+            raise LMSAPIError("Tenant {} has no API domain".format(self.client_key))
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout or getattr(settings, "IMS_LMS_TIMEOUT", 10)
+        self.session, self.semaphore = tenant_connections.get(self.client_key)
+
+    def get_url(self, path, params=None):
+        if path.startswith("https://") or path.startswith("http://"):
+            url = path  # pagination links are absolute
+        else:
+            url = "{}{}/{}".format(self.base_url, self.API_PREFIX, path.lstrip("/"))
+        if params:
+            url += ("&" if "?" in url else "?") + urlencode(params, doseq=True)
+        return url
+
+    def get_headers(self):
+        headers = {"Accept": "application/json"}
+        if self.tenant.api_secret:
+            headers["Authorization"] = "Bearer {}".format(self.tenant.api_secret)
+        return headers
+
+    def send(self, method, url, headers=None, **kwargs):
+        request_headers = self.get_headers()
+        request_headers.update(headers or {})
+        with self.semaphore:
+            response = self.session.request(method, url, headers=request_headers, timeout=self.timeout, **kwargs)
+        if response.status_code >= 400:
+            raise LMSAPIError("{} {} returned {}".format(method, url, response.status_code), response=response)
+        return response
+
+    @staticmethod
+    def get_next_url(response):
+        return response.links.get("next", {}).get("url", None)
+
+    @staticmethod
+    def get_data(response):
+        return response.json() if response.content else None
+
+    def get_cache_key(self, url):
+        cache = get_lms_cache()
+        version_key = get_course_version_key(self.client_key, self.course_id)
+        version = cache.get(version_key)
+        if version is None:
+            cache.add(version_key, uuid4().hex, None)
+            version = cache.get(version_key)
+        return "ims:lms:{}:{}:{}:{}".format(
+            self.client_key, self.course_id or "-", version,
+            md5(url.encode("utf-8")).hexdigest()
+        )
+
+    def fetch(self, url, cache=True):
+        """
+        Returns the decoded body and the URL of the next page of a GET request for an URL.
+        """
+        if not cache:
+            response = self.send("GET", url)
+            return self.get_data(response), self.get_next_url(response)
+        lms_cache = get_lms_cache()
+        key = self.get_cache_key(url)
+        entry = lms_cache.get(key)
+        now = time()
+        if entry is not None and entry["expires_at"] > now:
+            return entry["data"], entry["next"]
+        headers = {"If-None-Match": entry["etag"]} if entry is not None and entry["etag"] else {}
+        response = self.send("GET", url, headers=headers)
+        if response.status_code != 304 or entry is None:
+            entry = {
+                "etag": response.headers.get("ETag", None),
+                "data": self.get_data(response),
+                "next": self.get_next_url(response),
+            }
+        entry["expires_at"] = now + getattr(settings, "IMS_LMS_CACHE_TTL", 60)
+        lms_cache.set(key, entry, getattr(settings, "IMS_LMS_CACHE_TIMEOUT", 3600))
+        return entry["data"], entry["next"]
+
+    def get(self, path, params=None, cache=True):
+        data, next_url = self.fetch(self.get_url(path, params), cache=cache)
+        return data
+
+    def get_per_page(self):
+        """
+        Returns the page size to request from list endpoints or None to use the default page size of the LMS.
+        """
+        return None
+
+    def iter_pages(self, path, params=None, cache=True):
+        """
+        Yields the decoded body of every page of a list endpoint, following the next links of the Link header.
+        Pages get requested when the previous page has been consumed.
+        """
+        params = dict(params or {})
+        per_page = self.get_per_page()
+        if per_page and "per_page" not in params:
+            params["per_page"] = per_page
+        url = self.get_url(path, params)
+        while url:
+            data, url = self.fetch(url, cache=cache)
+            yield data
+
+    def iter_list(self, path, params=None, cache=True):
+        for page in self.iter_pages(path, params, cache=cache):
+            for item in page or []:
+                yield item
+
+    def request(self, method, path, json=None, params=None):
+        """
+        Sends a request that changes data and clears the cached responses of the course of the client.
+        """
+        response = self.send(method, self.get_url(path, params), json=json)
+        self.clear_cache()
+        return self.get_data(response)
+
+    def post(self, path, json=None, params=None):
+        return self.request("POST", path, json=json, params=params)
+
+    def put(self, path, json=None, params=None):
+        return self.request("PUT", path, json=json, params=params)
+
+    def delete(self, path, json=None, params=None):
+        return self.request("DELETE", path, json=json, params=params)
+
+    def clear_cache(self):
+        get_lms_cache().delete(get_course_version_key(self.client_key, self.course_id))
+
+
+class CanvasClient(LMSClient):
+    API_PREFIX = "/api/v1"
+
+    def get_per_page(self):
+        return getattr(settings, "IMS_LMS_PER_PAGE", 100)
+
+
+def get_lms_client(tenant, context=None, **kwargs):
+    """
+    Returns a client for the LMS of the tenant, which uses the api_domain and course_id of a LaunchContext if given.
+    """
+    if context is not None:
+        kwargs.setdefault("api_domain", context.api_domain)
+        kwargs.setdefault("course_id", context.course_id)
+    client_class = CanvasClient if tenant.lms == LearningManagementSystems.CANVAS else LMSClient
+    return client_class(tenant, **kwargs)
+
+
+def get_request_lms_client(request, **kwargs):
+    """
+    Returns a client for the tenant that launched the app of the request, or None if there was no launch.
+    """
+    context = getattr(request, "lti_context", None) or LaunchContext.from_session(request.session)
+    if context is None:
+        return None
+    try:
+        tenant = LTITenant.objects.get_cached(context.tenant_key)
+    except LTITenant.DoesNotExist:
+        return None
+    return get_lms_client(tenant, context, **kwargs)
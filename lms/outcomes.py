@@ -0,0 +1,144 @@
+import random
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests_oauthlib import OAuth1
+from requests_oauthlib.oauth1_auth import SIGNATURE_TYPE_AUTH_HEADER
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from lti import OutcomeRequest, OutcomeResponse
+from lti.outcome_request import REPLACE_REQUEST
+
+from ims.models import LTITenant, LTIOutcome, LTIOutcomeStatus
+from ims.launch_context import LaunchContext
+from ims.lms.client import tenant_connections
+
+
+def submit_score(request, score):
+    """
+    Queues a score between 0.0 and 1.0 for the user and resource of the launch of the request.
+    Returns False when the score replaced a score that wasn't sent yet
+    and None when the launch doesn't accept outcomes.
+    """
+    context = getattr(request, "lti_context", None) or LaunchContext.from_session(request.session)
+    if context is None or not context.outcome_service_url or not context.result_sourcedid:
+        return None
+    tenant = LTITenant.objects.get_cached(context.tenant_key)
+    return LTIOutcome.objects.submit(tenant, context.outcome_service_url, context.result_sourcedid, score)
+
+
+class OutcomeSender(object):
+    """
+    Sends queued outcomes with replaceResult requests that are signed with the credentials of their tenant.
+    Requests run in a pool of worker threads that share the pooled connections of the LMS API clients,
+    while the database only gets used by the thread that processes the queue.
+    Outcomes that fail because of network errors or server errors get retried with exponential backoff,
+    until they have been attempted IMS_LTI_OUTCOME_MAX_ATTEMPTS times.
+    Outcomes that the LMS refuses fail without retries.
+    """
+
+    def __init__(self, workers=4, batch_size=100, lease=300):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lease = lease
+        self.timeout = getattr(settings, "IMS_LMS_TIMEOUT", 10)
+        self.max_attempts = getattr(settings, "IMS_LTI_OUTCOME_MAX_ATTEMPTS", 10)
+        self.backoff = getattr(settings, "IMS_LTI_OUTCOME_BACKOFF", 30)
+        self.max_backoff = getattr(settings, "IMS_LTI_OUTCOME_MAX_BACKOFF", 3600)
+
+    @staticmethod
+    def get_request_xml(outcome):
+        outcome_request = OutcomeRequest({
+            "operation": REPLACE_REQUEST,
+            "score": outcome.score,
+            "message_identifier": "{}-{}".format(outcome.id, outcome.attempts),
+            "lis_outcome_service_url": outcome.service_url,
+            "lis_result_sourcedid": outcome.sourcedid,
+            "consumer_key": str(outcome.tenant.client_key),
+            "consumer_secret": outcome.tenant.client_secret,
+        })
+        return outcome_request.generate_request_xml()
+
+    def send(self, outcome):
+        """
+        Sends an outcome and returns the status that the outcome should get together with an error message.
+        """
+        auth = OAuth1(str(outcome.tenant.client_key), outcome.tenant.client_secret,
+                      signature_type=SIGNATURE_TYPE_AUTH_HEADER, force_include_body=True)
+        session, semaphore = tenant_connections.get(str(outcome.tenant.client_key))
+        try:
+            with semaphore:
+                response = session.post(outcome.service_url, data=self.get_request_xml(outcome), auth=auth,
+                                        headers={"Content-Type": "application/xml"}, timeout=self.timeout)
+        except requests.RequestException as exc:
+            return LTIOutcomeStatus.PENDING, "{}: {}".format(exc.__class__.__name__, exc)
+        if response.status_code >= 500 or response.status_code in (408, 429,):
+            return LTIOutcomeStatus.PENDING, "LMS returned {}".format(response.status_code)
+        if response.status_code >= 400:
+            return LTIOutcomeStatus.FAILED, "LMS returned {}".format(response.status_code)
+        outcome_response = OutcomeResponse.from_post_response(response, response.content)
+        if outcome_response.is_success():
+            return LTIOutcomeStatus.SENT, ""
+        if outcome_response.is_failure() or outcome_response.is_unsupported():
+            return LTIOutcomeStatus.FAILED, "LMS responded with {}: {}".format(
+                outcome_response.code_major, outcome_response.description
+            )
+        return LTIOutcomeStatus.PENDING, "LMS responded with {}".format(outcome_response.code_major)
+
+    def get_backoff(self, attempts):
+        # Jitter prevents outcomes that failed together from being retried together
+        backoff = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+        return timedelta(seconds=backoff * random.uniform(0.5, 1.0))
+
+    def record(self, outcome, status, error):
+        now = timezone.now()
+        attempts = outcome.attempts + 1
+        if status == LTIOutcomeStatus.PENDING and attempts >= self.max_attempts:
+            status = LTIOutcomeStatus.FAILED
+        updates = {
+            "status": status,
+            "attempts": F("attempts") + 1,
+            "last_error": error,
+            "modified_at": now,
+        }
+        if status == LTIOutcomeStatus.PENDING:
+            updates["next_attempt_at"] = now + self.get_backoff(attempts)
+        if not LTIOutcome.objects.filter(id=outcome.id, status=LTIOutcomeStatus.SENDING).update(**updates):
+            # A newer score superseded the outcome while it was sending. That score waits for this attempt,
+            # which is done now, so the newer score can be sent right away.
+            LTIOutcome.objects.filter(
+                tenant_id=outcome.tenant_id, sourcedid=outcome.sourcedid,
+                status=LTIOutcomeStatus.PENDING, next_attempt_at__gt=now
+            ).update(next_attempt_at=now)
+            return LTIOutcomeStatus.SUPERSEDED
+        return status
+
+    def run_once(self):
+        """
+        Sends a batch of outcomes that are due and returns the number of outcomes per resulting status.
+        """
+        outcomes = LTIOutcome.objects.claim(self.batch_size, self.lease)
+        counts = {}
+        if not outcomes:
+            return counts
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for outcome, (status, error) in zip(outcomes, executor.map(self.send, outcomes)):
+                status = self.record(outcome, status, error)
+                counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    @staticmethod
+    def prune(before):
+        """
+        Deletes sent and superseded outcomes that were last modified before the given datetime
+        and returns the number deleted.
+        """
+        count, deleted = LTIOutcome.objects.filter(
+            status__in=[LTIOutcomeStatus.SENT, LTIOutcomeStatus.SUPERSEDED],
+            modified_at__lt=before
+        ).delete()
+        return count
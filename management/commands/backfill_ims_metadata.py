@@ -0,0 +1,38 @@
+from django.db.models import Q
+from django.core.management.base import BaseCommand
+
+from ims.models import IMSArchive
+
+
+class Command(BaseCommand):
+    help = "Fills the metadata and outline fields of IMSArchive rows that were created before these fields existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--all", action="store_true", help="Also updates archives that have metadata already")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        queryset = IMSArchive.objects.order_by("id")
+        if not options["all"]:
+            # Common Cartridges without an export date and license may have been read as content packages
+            queryset = queryset.filter(
+                Q(schema_type="") | Q(outline="") |
+                Q(file__endswith="imscc", exported_at__isnull=True, license="")
+            )
+        fields = ["schema_type", "schema_version", "title", "exported_at", "license", "outline"]
+        last_id = 0
+        updated = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            for archive in batch:
+                archive.update_metadata_fields()
+                resources, content_tree = archive.read_manifest_structure()
+                archive.outline = content_tree.dumps()
+            IMSArchive.objects.bulk_update(batch, fields)
+            updated += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write("Updated metadata of {} archives".format(updated))
+        self.stdout.write(self.style.SUCCESS("Done, updated metadata of {} archives".format(updated)))
@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ims.benchmarks import LaunchBenchmark, SCENARIOS
+
+
+class Command(BaseCommand):
+    help = "Measures throughput, latency and queries of LTI launches for generated tenants and writes JSON results"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tenants", type=int, default=10)
+        parser.add_argument("--launches", type=int, default=200, help="Measured launches per scenario")
+        parser.add_argument("--users", type=int, default=20, help="Number of different users that launch")
+        parser.add_argument("--warmup", type=int, default=10, help="Unmeasured launches before every scenario")
+        parser.add_argument("--scenario", action="append", dest="scenarios",
+                            help="Name of a scenario to run, can be given multiple times. Defaults to all scenarios")
+        parser.add_argument("--async", action="store_true", dest="asynchronous",
+                            help="Launches through async_lti_launch and the async test client")
+        parser.add_argument("--nonce-store", default="ims.authorization.MemoryNonceStore")
+        parser.add_argument("--output", help="File to write the JSON results to instead of stdout")
+
+    def report_progress(self, summary):
+        self.stderr.write("{name}: {throughput:.1f} launches/s, p50 {p50:.2f}ms, p95 {p95:.2f}ms, p99 {p99:.2f}ms, "
+                          "{errors} errors".format(throughput=summary["throughput"] or 0, errors=summary["errors"],
+                                                   name=summary["name"], **summary["latency_ms"]))
+
+    def handle(self, *args, **options):
+        scenarios = SCENARIOS
+        if options["scenarios"]:
+            scenarios = [scenario for scenario in SCENARIOS if scenario.name in options["scenarios"]]
+            unknown = set(options["scenarios"]) - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError("Unknown scenarios: {}".format(", ".join(sorted(unknown))))
+        benchmark = LaunchBenchmark(
+            tenants=options["tenants"],
+            launches=options["launches"],
+            users=options["users"],
+            warmup=options["warmup"],
+            asynchronous=options["asynchronous"],
+            nonce_store=options["nonce_store"]
+        )
+        results = benchmark.run(scenarios, progress=self.report_progress)
+        output = json.dumps(results, indent=4)
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                output_file.write(output)
+        else:
+            self.stdout.write(output)
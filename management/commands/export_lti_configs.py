@@ -0,0 +1,30 @@
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ims.archives import stream_zip
+from ims.models import LTIApp
+from ims.views.lti import iter_lti_config_files
+
+
+class Command(BaseCommand):
+    help = "Writes the LTI configurations of all tenants of an app to a zip file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("app_slug")
+        parser.add_argument("output", help="Path of the zip file to write")
+        parser.add_argument("--host", help="Host to use in the configurations. Defaults to the DEFAULT_DOMAIN host")
+
+    def handle(self, *args, **options):
+        try:
+            app = LTIApp.objects.get(slug=options["app_slug"])
+        except LTIApp.DoesNotExist:
+            raise CommandError("LTIApp with slug {} does not exist".format(options["app_slug"]))
+        host = options["host"] or urlparse(settings.DEFAULT_DOMAIN).netloc
+        with open(options["output"], "wb") as output:
+            for chunk in stream_zip(iter_lti_config_files(app, host)):
+                output.write(chunk)
+        self.stdout.write(
+            self.style.SUCCESS("Done, exported configurations of {} to {}".format(app, options["output"]))
+        )
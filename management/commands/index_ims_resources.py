@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from ims.models import IMSArchive, IMSResource
+
+
+class Command(BaseCommand):
+    help = "Indexes the resources of IMSArchive rows that were created before resources got indexed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--all", action="store_true", help="Also re-indexes archives that have resources already")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        queryset = IMSArchive.objects.order_by("id")
+        if not options["all"]:
+            queryset = queryset.filter(resources__isnull=True)
+        last_id = 0
+        indexed = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            for archive in batch:
+                archive.pending_resources, content_tree = archive.read_manifest_structure()
+            IMSResource.objects.index_archives(batch)
+            indexed += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write("Indexed resources of {} archives".format(indexed))
+        self.stdout.write(self.style.SUCCESS("Done, indexed resources of {} archives".format(indexed)))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from ims.archives import find_archives, ingest_archives
+from ims.archives.ingestion import get_storage_name
+
+
+class Command(BaseCommand):
+    help = "Creates IMSArchive rows for all archives inside a directory or storage prefix using multiple processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="",
+                            help="A directory inside the media root or a storage prefix")
+        parser.add_argument("--processes", type=int, default=None,
+                            help="Number of worker processes, defaults to the number of cores")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def report_progress(self, report):
+        self.stdout.write(str(report))
+
+    def handle(self, *args, **options):
+        names = find_archives(get_storage_name(options["path"]))
+        report = ingest_archives(
+            names,
+            processes=options["processes"],
+            batch_size=options["batch_size"],
+            progress=self.report_progress
+        )
+        for name, error in report.failures:
+            self.stderr.write("{}: {}".format(name, error))
+        self.stdout.write(self.style.SUCCESS(str(report)))
@@ -0,0 +1,26 @@
+from time import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ims.authorization import DatabaseNonceStore
+from ims.models import LTITenant
+
+
+class Command(BaseCommand):
+    help = "Deletes LTI launch nonces from the database that can't be replayed anymore"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--age", type=int, default=None,
+            help="Minimal age in seconds of nonces to delete. Defaults to the timestamp lifetime of launches."
+        )
+        parser.add_argument("--all", action="store_true", help="Also deletes old nonces that are not from LTI tenants")
+
+    def handle(self, *args, **options):
+        age = options["age"]
+        if age is None:
+            age = getattr(settings, "IMS_LTI_TIMESTAMP_LIFETIME", 600)
+        client_keys = None if options["all"] else LTITenant.objects.values_list("client_key", flat=True)
+        count = DatabaseNonceStore.prune(time() - age, client_keys=client_keys)
+        self.stdout.write(self.style.SUCCESS("Done, deleted {} nonces".format(count)))
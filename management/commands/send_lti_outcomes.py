@@ -0,0 +1,36 @@
+from time import sleep
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ims.lms import OutcomeSender
+
+
+class Command(BaseCommand):
+    help = "Sends queued LTI outcomes to the LMS of their tenant using a pool of worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Number of concurrent requests to LMS's")
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--lease", type=int, default=300,
+                            help="Seconds after which outcomes that are still sending can be claimed again")
+        parser.add_argument("--loop", action="store_true", help="Keeps sending outcomes until interrupted")
+        parser.add_argument("--interval", type=float, default=5.0,
+                            help="Seconds to wait when there are no outcomes to send while looping")
+        parser.add_argument("--prune-days", type=int, default=7,
+                            help="Deletes sent and superseded outcomes older than this number of days "
+                                 "after every batch")
+
+    def handle(self, *args, **options):
+        sender = OutcomeSender(workers=options["workers"], batch_size=options["batch_size"], lease=options["lease"])
+        while True:
+            counts = sender.run_once()
+            sender.prune(timezone.now() - timedelta(days=options["prune_days"]))
+            if counts:
+                self.stdout.write(", ".join("{} {}".format(count, status) for status, count in sorted(counts.items())))
+            if not options["loop"]:
+                break
+            if not counts:
+                sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ims', '0003_ltitenant_lms_domain'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imsarchive',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='imsarchive',
+            name='file_modified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imsarchive',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imsarchive',
+            name='manifest_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+    ]
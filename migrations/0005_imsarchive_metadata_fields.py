@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ims', '0004_imsarchive_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imsarchive',
+            name='exported_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imsarchive',
+            name='license',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='imsarchive',
+            name='schema_type',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='imsarchive',
+            name='schema_version',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='imsarchive',
+            name='title',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+    ]
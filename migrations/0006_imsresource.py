@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ims', '0005_imsarchive_metadata_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IMSResource',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('identifier', models.CharField(max_length=255)),
+                ('title', models.TextField(blank=True)),
+                ('content_type', models.CharField(db_index=True, max_length=255)),
+                ('main', models.CharField(blank=True, db_index=True, max_length=512)),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resources', to='ims.imsarchive')),
+            ],
+            options={
+                'verbose_name': 'IMS resource',
+                'unique_together': {('archive', 'identifier')},
+            },
+        ),
+        migrations.CreateModel(
+            name='IMSResourceFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('href', models.CharField(db_index=True, max_length=512)),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='ims.imsresource')),
+            ],
+            options={
+                'verbose_name': 'IMS resource file',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ims', '0006_imsresource'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imsarchive',
+            name='outline',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
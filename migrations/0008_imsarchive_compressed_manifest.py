@@ -0,0 +1,62 @@
+from django.db import migrations, transaction
+
+import ims.models.fields
+
+
+BATCH_SIZE = 100
+
+
+def copy_manifests(apps, source, target):
+    IMSArchive = apps.get_model('ims', 'IMSArchive')
+    queryset = IMSArchive.objects.order_by('id').only('id', source)
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        for archive in batch:
+            setattr(archive, target, getattr(archive, source) or '')
+        with transaction.atomic():
+            IMSArchive.objects.bulk_update(batch, [target])
+        last_id = batch[-1].id
+
+
+def compress_manifests(apps, schema_editor):
+    copy_manifests(apps, 'manifest', 'compressed_manifest')
+
+
+def decompress_manifests(apps, schema_editor):
+    copy_manifests(apps, 'compressed_manifest', 'manifest')
+
+
+class Migration(migrations.Migration):
+
+    # Every batch of manifests gets committed separately
+    atomic = False
+
+    dependencies = [
+        ('ims', '0007_imsarchive_outline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imsarchive',
+            name='compressed_manifest',
+            field=ims.models.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.RunPython(compress_manifests, decompress_manifests),
+        migrations.RemoveField(
+            model_name='imsarchive',
+            name='manifest',
+        ),
+        migrations.RenameField(
+            model_name='imsarchive',
+            old_name='compressed_manifest',
+            new_name='manifest',
+        ),
+        migrations.AlterField(
+            model_name='imsarchive',
+            name='manifest',
+            field=ims.models.fields.CompressedTextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ims', '0008_imsarchive_compressed_manifest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LTIOutcome',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_url', models.URLField(max_length=512)),
+                ('sourcedid', models.CharField(max_length=255)),
+                ('score', models.FloatField()),
+                ('status', models.CharField(choices=[('failed', 'failed'), ('pending', 'pending'), ('sending', 'sending'), ('sent', 'sent')], default='pending', max_length=50)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outcomes', to='ims.ltitenant')),
+            ],
+            options={
+                'verbose_name': 'LTI outcome',
+                'verbose_name_plural': 'LTI outcomes',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ltioutcome',
+            index=models.Index(fields=['tenant', 'sourcedid', 'status'], name='ims_ltioutc_tenant__8ddb94_idx'),
+        ),
+    ]
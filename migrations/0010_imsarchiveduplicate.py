@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ims', '0009_ltioutcome'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IMSArchiveDuplicate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.CharField(max_length=255, unique=True)),
+                ('file_size', models.BigIntegerField()),
+                ('file_modified_at', models.DateTimeField()),
+                ('file_hash', models.CharField(max_length=64)),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicates', to='ims.imsarchive')),
+            ],
+            options={
+                'verbose_name': 'IMS archive duplicate',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ims', '0010_imsarchiveduplicate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ltioutcome',
+            name='status',
+            field=models.CharField(choices=[('failed', 'failed'), ('pending', 'pending'), ('sending', 'sending'), ('sent', 'sent'), ('superseded', 'superseded')], default='pending', max_length=50),
+        ),
+    ]
@@ -1,2 +1,3 @@
-from ims.models.content import IMSArchive, CommonCartridge, ContentPackage
-from ims.models.lti import LTIApp, LTITenant, LTIPrivacyLevels
+from ims.models.content import IMSArchive, CommonCartridge, ContentPackage, IMSResource, IMSResourceFile, \
+    IMSArchiveDuplicate
+from ims.models.lti import LTIApp, LTITenant, LTIPrivacyLevels, LTIOutcome, LTIOutcomeStatus
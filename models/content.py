@@ -1,37 +1,232 @@
 import json
 import os
-from zipfile import ZipFile
+import hashlib
+import posixpath
+from datetime import datetime, timezone as dt_timezone
+from zipfile import ZipFile, BadZipFile
+from urllib.parse import unquote
 
-from bs4 import BeautifulSoup
+from bs4 import UnicodeDammit
+from lxml.etree import XMLSyntaxError
 
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
 from django.core.exceptions import ValidationError
 from django.utils.html import format_html
 from django.core.files.storage import default_storage
 
+from ims.models.fields import CompressedTextField
+from ims.parsers import ParsedManifest, StreamingManifest, ContentTree
+from ims.archives import zip_handles, extraction_cache
+
+
+SCHEMA_PATH = ('schema',)
+SCHEMA_VERSION_PATH = ('schemaversion',)
+LOM_TITLE_PATH = ('lomimscc:title', 'lomimscc:string',)
+LOM_EXPORT_PATH = ('lomimscc:contribute', 'lomimscc:date', 'lomimscc:datetime',)
+LOM_LICENSE_PATH = ('lomimscc:rights', 'lomimscc:description', 'lomimscc:string',)
+IMSMD_TITLE_PATH = ('imsmd:title', 'imsmd:langstring',)
+
+
+def set_primary_keys(instances, queryset, fields, get_key):
+    """
+    Sets the primary keys of instances that were created with bulk_create, because not all databases return them.
+    Rows of the queryset get matched to instances by the values of fields, which get_key returns for an instance.
+    """
+    if all(instance.pk is not None for instance in instances):
+        return
+    primary_keys = {tuple(values): pk for pk, *values in queryset.values_list('pk', *fields)}
+    for instance in instances:
+        instance.pk = primary_keys[get_key(instance)]
+
+
+class IMSArchiveQuerySet(models.QuerySet):
+
+    def containing_resources(self, content_type=None, href=None):
+        """
+        Filters archives on the resources inside of them using the IMSResource index.
+        """
+        resources = IMSResource.objects.all()
+        if content_type is not None:
+            resources = resources.of_type(content_type)
+        if href is not None:
+            resources = resources.referencing(href)
+        return self.filter(id__in=resources.values('archive_id'))
+
+
+class IMSArchiveManager(models.Manager.from_queryset(IMSArchiveQuerySet)):
+
+    def get_queryset(self):
+        # Manifests are large, so they only get loaded and decompressed when they get accessed
+        return super().get_queryset().defer('manifest')
+
 
 class IMSArchive(models.Model):
 
     file = models.FileField()
-    manifest = models.TextField(blank=True)
+    manifest = CompressedTextField(blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    file_size = models.BigIntegerField(null=True, blank=True, editable=False)
+    file_modified_at = models.DateTimeField(null=True, blank=True, editable=False)
+    file_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    manifest_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+
+    schema_type = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+    schema_version = models.CharField(max_length=50, blank=True, db_index=True, editable=False)
+    title = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+    exported_at = models.DateTimeField(null=True, blank=True, db_index=True, editable=False)
+    license = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+    outline = models.TextField(blank=True, editable=False)
+
+    objects = IMSArchiveManager()
+
     @classmethod
     def from_file_path(cls, file_path):
-        archive = cls()
-        archive.file.name = file_path.replace(default_storage.location, '').lstrip('/')
+        """
+        Returns an IMSArchive for the archive at file_path.
+        When the file is known already the existing IMSArchive gets returned, cleaned again only if the file changed.
+        New files that are byte identical to a known archive return that known archive.
+        """
+        name = file_path.replace(default_storage.location, '').lstrip('/')
+        archive = cls.objects.filter(file=name).first()
+        if archive is None:
+            archive = cls()
+            archive.file.name = name
+            archive.set_archive_class()
         archive.clean()
+        if archive.pk is None:
+            identical = cls.objects.filter(file_hash=archive.file_hash).first()
+            if identical is not None:
+                return identical
         return archive
 
-    def get_resources(self):
-        manifest = BeautifulSoup(self.manifest, "lxml")
+    def is_file_committed(self):
+        # Uploads from forms only exist as uploaded files until the archive gets saved
+        return self.file._committed
+
+    def get_file_fingerprint(self):
+        """
+        Returns the size and modification time of the file, which are cheap to get compared to reading the file.
+        Modification times are truncated to seconds, because not all databases store microseconds.
+        Uploads that are not saved yet don't have a modification time.
+        """
+        if not self.is_file_committed():
+            return self.file.size, None
+        storage = self.file.storage
+        modified_at = storage.get_modified_time(self.file.name).replace(microsecond=0)
+        return storage.size(self.file.name), modified_at
+
+    def has_file_changed(self):
+        if not self.is_file_committed():
+            return True
+        if not self.file_hash or self.file_size is None or self.file_modified_at is None:
+            return True
+        return self.get_file_fingerprint() != (self.file_size, self.file_modified_at,)
+
+    def get_file_hash(self, chunk_size=1024 * 1024):
+        file_hash = hashlib.sha256()
+        if not self.is_file_committed():
+            for chunk in self.file.chunks(chunk_size):
+                file_hash.update(chunk)
+            return file_hash.hexdigest()
+        with self.file.storage.open(self.file.name, 'rb') as file:
+            chunk = file.read(chunk_size)
+            while chunk:
+                file_hash.update(chunk)
+                chunk = file.read(chunk_size)
+        return file_hash.hexdigest()
+
+    def get_parsed_manifest(self):
+        """
+        Returns the manifest parsed into a ParsedManifest.
+        The parse gets memoized on the instance until a different manifest gets assigned.
+        """
+        cached = getattr(self, '_parsed_manifest', None)
+        if cached is not None and cached[0] is self.manifest:
+            return cached[1]
+        parsed = ParsedManifest(self.manifest)
+        self._parsed_manifest = (self.manifest, parsed,)
+        return parsed
+
+    def get_zip_file(self):
+        if not self.is_file_committed():
+            return ZipFile(self.file)
+        return zip_handles.get(self.file.storage, self.file.name)
+
+    def open_member(self, name):
+        if not self.is_file_committed():
+            return self.get_zip_file().open(name)
+        return zip_handles.open_member(self.file.storage, self.file.name, name)
+
+    def get_member_name(self, href):
+        """
+        Returns the name of the archive member that a manifest href refers to.
+        Hrefs are URL's relative to the archive root, so they may be quoted or contain relative path segments.
+        """
+        archive = self.get_zip_file()
+        for candidate in (href, unquote(href)):
+            candidate = posixpath.normpath(candidate).lstrip('/')
+            try:
+                return archive.getinfo(candidate).filename
+            except KeyError:
+                continue
+        raise FileNotFoundError('{} does not contain {}'.format(self, href))
+
+    def open_file(self, href):
+        """
+        Opens a single file inside the archive for reading without extracting the archive.
+        """
+        return self.open_member(self.get_member_name(href))
+
+    def stream_file(self, href, chunk_size=64 * 1024):
+        with self.open_file(href) as file:
+            chunk = file.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = file.read(chunk_size)
+
+    def open_resource(self, identifier):
+        """
+        Opens the main file of a resource or the first of its files if the resource does not specify a main file.
+        """
+        resource = self.get_resources()[identifier]
+        href = resource['main'] or next(iter(resource['files']), None)
+        if href is None:
+            raise FileNotFoundError('Resource {} of {} does not have any files'.format(identifier, self))
+        return self.open_file(href)
+
+    def open_manifest(self):
+        """
+        Opens the imsmanifest.xml inside the archive file for reading without loading it into memory.
+        """
+        try:
+            return self.open_member('imsmanifest.xml')
+        except KeyError:
+            raise ValidationError('The IMS archive should contain a imsmanifest.xml file')
+
+    def get_streaming_manifest(self, metadata_paths=tuple()):
+        return StreamingManifest(self.open_manifest(), metadata_paths=metadata_paths)
+
+    def get_metadata_texts(self, paths, streaming=False):
+        if streaming:
+            with self.get_streaming_manifest(metadata_paths=paths) as manifest:
+                return manifest.get_metadata()
+        manifest = self.get_parsed_manifest()
+        return {path: manifest.find_text(path) for path in paths}
+
+    def get_resources(self, streaming=False):
+        if streaming:
+            with self.get_streaming_manifest() as manifest:
+                return manifest.get_resources()
+        manifest = self.get_parsed_manifest()
         results = {}
-        resources = manifest.find_all('resource', identifier=True)
-        for resource in resources:
-            item = manifest.find(attrs={'identifierref': resource['identifier']})
+        for identifier, resource in manifest.resources.items():
+            item = manifest.get_referencing_element(identifier)
             title = item.find('title', None) if item else None
-            results[resource['identifier']] = {
+            results[identifier] = {
                 'title': title.text if title else None,
                 'content_type': resource['type'],
                 'main': resource.get('href', None),
@@ -40,22 +235,141 @@ class IMSArchive(models.Model):
         return results
 
     def get_extract_destination(self):
-        tail, head = os.path.split(self.file.name)
-        return os.path.join(settings.MEDIA_ROOT, "tmp", head)
+        return extraction_cache.get_destination(self.file.name)
 
     def extract(self):
-        destination = self.get_extract_destination()
-        if os.path.exists(destination):
-            return
-        archive = ZipFile(self.file)
-        archive.extractall(destination)
+        return extraction_cache.extract(self.file.storage, self.file.name)
+
+    def extracted(self):
+        """
+        Context manager that yields the directory with the extracted archive and prevents its removal until it exits.
+        """
+        return extraction_cache.reading(self.file.storage, self.file.name)
 
     def clean(self):
-        archive = ZipFile(self.file)
+        self.set_archive_class()
+        if not self.has_file_changed():  # the fingerprint only gets set when the manifest gets read
+            return
+        self.update_file_fields()
+        self.update_manifest_fields()
+
+    def update_file_fields(self):
+        """
+        Sets the fingerprint and hash of the file, which is all that is needed to find byte identical archives.
+        """
+        zip_handles.discard(self.file.name)  # the file under this name may have been replaced
+        self.file_size, self.file_modified_at = self.get_file_fingerprint()
+        self.file_hash = self.get_file_hash()
+
+    def update_manifest_fields(self):
+        """
+        Reads the manifest from the file and sets the manifest, metadata and outline fields.
+        """
+        try:
+            archive = ZipFile(self.file)
+        except BadZipFile:
+            raise ValidationError('The IMS archive should be a zip file')
         try:
-            self.manifest = archive.read('imsmanifest.xml')
+            manifest = archive.read('imsmanifest.xml')
         except KeyError:
             raise ValidationError('The IMS archive should contain a imsmanifest.xml file')
+        self.manifest_hash = hashlib.sha256(manifest).hexdigest()
+        # The manifest is stored as text, so we decode it respecting the XML declaration
+        self.manifest = UnicodeDammit(manifest, is_html=False).unicode_markup
+        self.update_metadata_fields()
+        # Resources get indexed upon save, because the archive may not have a primary key yet
+        self.pending_resources, content_tree = self.read_manifest_structure()
+        self.outline = content_tree.dumps()
+
+    def save(self, *args, **kwargs):
+        if not self.is_file_committed():
+            # Uploads get stored before the rest, because the fingerprint should describe the stored file
+            self.file.save(self.file.name, self.file.file, save=False)
+            self.file_size, self.file_modified_at = self.get_file_fingerprint()
+        super().save(*args, **kwargs)
+        if getattr(self, 'pending_resources', None) is not None:
+            IMSResource.objects.index_archives([self])
+
+    def read_manifest(self, stream, parse):
+        """
+        Returns the result of stream, which reads the manifest from the archive file with the streaming parser.
+        Falls back to the result of parse, which reads the stored manifest, when the streaming parser can't be used.
+        """
+        try:
+            return stream()
+        except XMLSyntaxError:  # BeautifulSoup is more lenient than the streaming parser
+            return parse()
+        except Exception:
+            # Files may be gone for older archives, in which case we fall back to the stored manifest
+            if self.is_file_committed() and not self.file.storage.exists(self.file.name):
+                return parse()
+            raise
+
+    def read_manifest_structure(self):
+        """
+        Returns the resources and the ContentTree of the archive, which get read from the file in a single pass.
+        """
+        def stream():
+            resources = {}
+            items = []
+            with self.get_streaming_manifest() as manifest:
+                for event, identifier, data in manifest:
+                    if event == manifest.RESOURCE:
+                        resources[identifier] = data
+                    elif event == manifest.ITEM:
+                        items.append(dict(data, identifier=identifier))
+            return resources, ContentTree.from_items(items)
+
+        def parse():
+            return self.get_resources(), ContentTree.from_parsed_manifest(self.get_parsed_manifest())
+
+        return self.read_manifest(stream, parse)
+
+    def get_outline(self):
+        """
+        Returns the content tree of the first organization as a ContentTree.
+        Unlike get_content_tree this doesn't need to parse the manifest for archives that were cleaned.
+        """
+        if self.outline:
+            return ContentTree.loads(self.outline)
+        return ContentTree.from_parsed_manifest(self.get_parsed_manifest())
+
+    @staticmethod
+    def parse_export_date(value):
+        if not value:
+            return None
+        value = value.strip()
+        try:
+            exported_at = parse_datetime(value)
+            if exported_at is None:
+                date = parse_date(value)
+                exported_at = datetime(date.year, date.month, date.day) if date else None
+        except ValueError:  # well formatted, but invalid dates
+            return None
+        if exported_at is not None and settings.USE_TZ and timezone.is_naive(exported_at):
+            exported_at = timezone.make_aware(exported_at, dt_timezone.utc)
+        return exported_at
+
+    def update_metadata_fields(self, streaming=True):
+        """
+        Copies metadata from the manifest to model fields, which makes it possible to query and index metadata.
+        By default the metadata gets read from the archive file,
+        because the streaming parser stops as soon as it found all metadata.
+        """
+        self.set_archive_class()  # the metadata to copy depends on the type of archive
+        try:
+            if streaming:
+                metadata = self.read_manifest(lambda: self.get_metadata(streaming=True), self.get_metadata)
+            else:
+                metadata = self.get_metadata()
+        except AttributeError:  # ParsedManifest raises when metadata is missing
+            metadata = {}
+        schema = metadata.get('schema', {})
+        self.schema_type = (schema.get('type', None) or '')[:255]
+        self.schema_version = (schema.get('version', None) or '')[:50]
+        self.title = (metadata.get('title', None) or '')[:255]
+        self.exported_at = self.parse_export_date(metadata.get('export_at', None))
+        self.license = (metadata.get('license', None) or '')[:255]
 
     def metadata_tag(self):
         return format_html('<pre>{}</pre>', json.dumps(self.get_metadata(), indent=4))
@@ -64,38 +378,149 @@ class IMSArchive(models.Model):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if not isinstance(self, (CommonCartridge, ContentPackage)):
-            if self.file.name.endswith("imscc"):
-                self.__class__ = CommonCartridge
-            else:
-                self.__class__ = ContentPackage
+            self.set_archive_class()
+
+    def set_archive_class(self):
+        """
+        Turns the archive into a CommonCartridge or ContentPackage based on the name of its file.
+        Call this whenever the name gets set after construction, because the proxy determines the metadata.
+        """
+        if (self.file.name or "").endswith("imscc"):
+            self.__class__ = CommonCartridge
+        else:
+            self.__class__ = ContentPackage
 
     def __str__(self):
         tail, head = os.path.split(self.file.name)
         return head
 
-    def get_metadata(self):
+    def get_metadata(self, streaming=False):
         raise NotImplementedError("get_metadata is not available")
 
     def get_content_tree(self):
         raise NotImplementedError("get_content_tree is not available")
 
 
+class IMSResourceQuerySet(models.QuerySet):
+
+    def of_type(self, content_type):
+        return self.filter(content_type=content_type)
+
+    def referencing(self, href):
+        return self.filter(id__in=IMSResourceFile.objects.filter(href=href).values('resource_id'))
+
+    def index_archives(self, archives, batch_size=1000):
+        """
+        Replaces the indexed resources of the given archives with their pending_resources,
+        which get set when an archive is cleaned.
+        Archives without a primary key or without pending resources are skipped.
+        """
+        archives = [
+            archive for archive in archives
+            if archive.pk is not None and getattr(archive, 'pending_resources', None) is not None
+        ]
+        if not archives:
+            return
+        IMSResourceFile.objects.filter(resource__archive__in=archives).delete()
+        self.filter(archive__in=archives).delete()
+        resources = [
+            IMSResource(
+                archive_id=archive.pk,
+                identifier=identifier[:255],
+                title=resource['title'] or '',
+                content_type=(resource['content_type'] or '')[:255],
+                main=(resource['main'] or '')[:512]
+            )
+            for archive in archives
+            for identifier, resource in archive.pending_resources.items()
+        ]
+        self.bulk_create(resources, batch_size=batch_size)
+        set_primary_keys(
+            resources, self.filter(archive__in=archives), ['archive_id', 'identifier'],
+            lambda resource: (resource.archive_id, resource.identifier,)
+        )
+        resource_ids = {(resource.archive_id, resource.identifier,): resource.pk for resource in resources}
+        files = [
+            IMSResourceFile(resource_id=resource_ids[(archive.pk, identifier[:255],)], href=href[:512])
+            for archive in archives
+            for identifier, resource in archive.pending_resources.items()
+            for href in resource['files']
+        ]
+        IMSResourceFile.objects.bulk_create(files, batch_size=batch_size)
+        for archive in archives:
+            archive.pending_resources = None
+
+
+class IMSResource(models.Model):
+
+    archive = models.ForeignKey(IMSArchive, on_delete=models.CASCADE, related_name='resources')
+    identifier = models.CharField(max_length=255)
+    title = models.TextField(blank=True)
+    content_type = models.CharField(max_length=255, db_index=True)
+    main = models.CharField(max_length=512, blank=True, db_index=True)
+
+    objects = IMSResourceQuerySet.as_manager()
+
+    def get_files(self):
+        return [file.href for file in self.files.all()]
+
+    def __str__(self):
+        return '{} ({})'.format(self.identifier, self.content_type)
+
+    class Meta:
+        verbose_name = 'IMS resource'
+        unique_together = ('archive', 'identifier',)
+
+
+class IMSResourceFile(models.Model):
+
+    resource = models.ForeignKey(IMSResource, on_delete=models.CASCADE, related_name='files')
+    href = models.CharField(max_length=512, db_index=True)
+
+    def __str__(self):
+        return self.href
+
+    class Meta:
+        verbose_name = 'IMS resource file'
+
+
+class IMSArchiveDuplicate(models.Model):
+    """
+    Records files that are byte identical to an archive, which allows ingestion to skip them until they change.
+    """
+
+    archive = models.ForeignKey(IMSArchive, on_delete=models.CASCADE, related_name='duplicates')
+    file = models.CharField(max_length=255, unique=True)
+    file_size = models.BigIntegerField()
+    file_modified_at = models.DateTimeField()
+    file_hash = models.CharField(max_length=64)
+
+    def __str__(self):
+        return self.file
+
+    class Meta:
+        verbose_name = 'IMS archive duplicate'
+
+
 class CommonCartridge(IMSArchive):
 
-    def get_metadata(self):
-        manifest = BeautifulSoup(self.manifest, "lxml")
+    def get_metadata(self, streaming=False):
+        texts = self.get_metadata_texts(
+            [SCHEMA_PATH, SCHEMA_VERSION_PATH, LOM_TITLE_PATH, LOM_EXPORT_PATH, LOM_LICENSE_PATH],
+            streaming=streaming
+        )
         return {
             'schema': {
-                'type': manifest.find('schema').text,
-                'version': manifest.find('schemaversion').text
+                'type': texts[SCHEMA_PATH],
+                'version': texts[SCHEMA_VERSION_PATH]
             },
-            'title': manifest.find('lomimscc:title').find('lomimscc:string').text,
-            'export_at': manifest.find('lomimscc:contribute').find('lomimscc:date').find('lomimscc:datetime').text,
-            'license': manifest.find('lomimscc:rights').find('lomimscc:description').find('lomimscc:string').text
+            'title': texts[LOM_TITLE_PATH],
+            'export_at': texts[LOM_EXPORT_PATH],
+            'license': texts[LOM_LICENSE_PATH]
         }
 
     def get_content_tree(self):
-        manifest = BeautifulSoup(self.manifest, "lxml")
+        manifest = self.get_parsed_manifest()
         return manifest.find('organization').find('item')
 
     class Meta:
@@ -104,21 +529,25 @@ class CommonCartridge(IMSArchive):
 
 class ContentPackage(IMSArchive):
 
-    def get_metadata(self):
-        manifest = BeautifulSoup(self.manifest, "lxml")
-        schema = manifest.find('schema').text
-        title = manifest.find('lomimscc:title').find('lomimscc:string').text if schema == "IMS Common Cartridge" else \
-            manifest.find('imsmd:title').find('imsmd:langstring').text
+    def get_metadata(self, streaming=False):
+        # When streaming we get both titles in one pass, otherwise only the title that matches the schema
+        title_paths = [LOM_TITLE_PATH, IMSMD_TITLE_PATH] if streaming else []
+        texts = self.get_metadata_texts([SCHEMA_PATH, SCHEMA_VERSION_PATH] + title_paths, streaming=streaming)
+        schema = texts[SCHEMA_PATH]
+        title_path = LOM_TITLE_PATH if schema == "IMS Common Cartridge" else IMSMD_TITLE_PATH
+        if title_path not in texts:
+            texts.update(self.get_metadata_texts([title_path]))
+        title = texts[title_path]
         return {
             'schema': {
                 'type': schema,
-                'version': manifest.find('schemaversion').text
+                'version': texts[SCHEMA_VERSION_PATH]
             },
             'title': title
         }
 
     def get_content_tree(self):  # TODO: test in pol-harvester
-        manifest = BeautifulSoup(self.manifest, "lxml")
+        manifest = self.get_parsed_manifest()
         return manifest.find('organization').find_all('item')
 
     class Meta:
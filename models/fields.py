@@ -0,0 +1,46 @@
+import zlib
+
+from django.db import models
+
+
+class CompressedTextField(models.BinaryField):
+    """
+    Stores text compressed with zlib in a binary column, while the model attribute remains a string.
+    Decompression happens when the value gets loaded from the database,
+    so defer this field to only pay for decompression when the value gets accessed.
+    """
+
+    description = "Text compressed with zlib"
+
+    def __init__(self, *args, compression_level=6, **kwargs):
+        self.compression_level = compression_level
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.compression_level != 6:
+            kwargs["compression_level"] = self.compression_level
+        return name, path, args, kwargs
+
+    def _check_str_default_value(self):
+        return []  # unlike BinaryField this field holds text, so string defaults are valid
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        return zlib.compress(value, self.compression_level)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return zlib.decompress(bytes(value)).decode("utf-8")
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return bytes(value).decode("utf-8")
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
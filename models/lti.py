@@ -1,13 +1,22 @@
 import uuid
+from datetime import timedelta
 from oauthlib.common import generate_token
 
 from django.conf import settings
 from django.db import models
+from django.db.models import Max, Exists, OuterRef
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.core.cache import caches
 from django.urls import reverse, NoReverseMatch, resolve, Resolver404
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 from datagrowth.configuration.fields import ConfigurationField
 
+from ims.dispatch import resolve_view, launch_dispatcher
+from ims.launch_context import LaunchContext, start_launch_context
+
 
 class LTIPrivacyLevels(object):
     ANONYMOUS = 'anonymous'
@@ -21,6 +30,42 @@ PRIVACY_LEVEL_CHOICES = tuple([
 ])
 
 
+LTI_CACHE_TIMEOUT = getattr(settings, "IMS_LTI_CACHE_TIMEOUT", 300)
+
+
+def get_lti_cache():
+    return caches[getattr(settings, "IMS_LTI_CACHE", "default")]
+
+
+def get_app_cache_key(slug):
+    return "ims:lti:app:{}".format(slug)
+
+
+def get_tenant_cache_key(client_key):
+    return "ims:lti:tenant:{}".format(client_key)
+
+
+def get_config_version_key(app_slug):
+    # Rendered configurations are cached under a version per app, which gets reset when the app or its tenants change
+    return "ims:lti:config-version:{}".format(app_slug)
+
+
+class LTIAppManager(models.Manager):
+
+    def get_cached(self, slug):
+        """
+        Returns the LTIApp with the given slug from the LTI cache or the database.
+        Raises LTIApp.DoesNotExist when there is no such app.
+        """
+        cache = get_lti_cache()
+        key = get_app_cache_key(slug)
+        app = cache.get(key)
+        if app is None:
+            app = self.get(slug=slug)
+            cache.set(key, app, LTI_CACHE_TIMEOUT)
+        return app
+
+
 class LTIApp(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -33,6 +78,15 @@ class LTIApp(models.Model):
     description = models.TextField()
     privacy_level = models.CharField(max_length=50, choices=PRIVACY_LEVEL_CHOICES)
 
+    objects = LTIAppManager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The cache holds apps under their slug, so we need to know the old slug when it changes
+        instance._loaded_slug = instance.__dict__.get("slug", None)
+        return instance
+
     def __str__(self):
         return self.title
 
@@ -43,7 +97,7 @@ class LTIApp(models.Model):
         except Resolver404:
             pass
         try:
-            reverse(self.view)
+            resolve_view(self.view)
         except NoReverseMatch:
             raise ValidationError(
                 'No reverse match found for view "{}". Please specify a valid view.'.format(self.view)
@@ -64,6 +118,30 @@ LMS_CHOICES = tuple([
 ])
 
 
+class LTITenantManager(models.Manager):
+
+    def get_cached(self, client_key):
+        """
+        Returns the LTITenant with the given client key from the LTI cache or the database.
+        The tenant comes with its app, which gets cached under its slug as well.
+        Raises LTITenant.DoesNotExist when there is no such tenant or when the client key is not a valid UUID.
+        """
+        try:
+            client_key = uuid.UUID(str(client_key))
+        except ValueError:
+            raise self.model.DoesNotExist("{} is not a valid client key".format(client_key))
+        cache = get_lti_cache()
+        key = get_tenant_cache_key(client_key)
+        tenant = cache.get(key)
+        if tenant is None:
+            tenant = self.select_related("app").get(client_key=client_key)
+            cache.set_many({
+                key: tenant,
+                get_app_cache_key(tenant.app.slug): tenant.app
+            }, LTI_CACHE_TIMEOUT)
+        return tenant
+
+
 class LTITenant(models.Model):
 
     app = models.ForeignKey(LTIApp, on_delete=models.CASCADE)
@@ -81,22 +159,51 @@ class LTITenant(models.Model):
     modified_at = models.DateTimeField(auto_now=True, editable=False)
     lms_domain = models.URLField(max_length=512, null=True)
 
-    def _start_generic_session(self, launch_request, data):
-        launch_request.session['roles'] = ''
-        launch_request.session['api_domain'] = None
-        launch_request.session['course_id'] = None
+    objects = LTITenantManager()
 
-    def _start_canvas_session(self, launch_request, data):
-        launch_request.session['roles'] = data.get('roles', '')
-        launch_request.session['api_domain'] = data.get('custom_canvas_api_domain', None)
-        launch_request.session['course_id'] = data.get('custom_canvas_course_id', None)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Configurations are cached per app, so we need to know the old app when it changes
+        instance._loaded_app_id = instance.__dict__.get("app_id", None)
+        return instance
 
-    def start_session(self, launch_request, data):
-        launch_request.session['tenant_key'] = str(self.client_key)
+    def __getstate__(self):
+        # Configurations can't be unpickled, so we pickle the configuration as a dictionary for the LTI cache
+        state = super().__getstate__()
+        state["config"] = self.config.to_dict(private=True, protected=True)
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        config = state.pop("config", {})
+        super().__setstate__(state)
+        self.config = config
+
+    def _get_generic_launch_context(self, data):
+        return LaunchContext(
+            str(self.client_key),
+            outcome_service_url=data.get('lis_outcome_service_url', None),
+            result_sourcedid=data.get('lis_result_sourcedid', None)
+        )
+
+    def _get_canvas_launch_context(self, data):
+        return LaunchContext(
+            str(self.client_key),
+            roles=data.get('roles', ''),
+            api_domain=data.get('custom_canvas_api_domain', None),
+            course_id=data.get('custom_canvas_course_id', None),
+            outcome_service_url=data.get('lis_outcome_service_url', None),
+            result_sourcedid=data.get('lis_result_sourcedid', None)
+        )
+
+    def get_launch_context(self, data):
         if self.lms == LearningManagementSystems.CANVAS:
-            self._start_canvas_session(launch_request, data)
-        else:
-            self._start_generic_session(launch_request, data)
+            return self._get_canvas_launch_context(data)
+        return self._get_generic_launch_context(data)
+
+    def start_session(self, launch_request, data):
+        start_launch_context(launch_request, self.get_launch_context(data))
 
     def get_lti_config_url(self):
         return "{}{}".format(settings.DEFAULT_DOMAIN, reverse('lti-config', args=(self.app.slug, self.slug,)))
@@ -108,3 +215,136 @@ class LTITenant(models.Model):
     class Meta:
         verbose_name = 'LTI tenant'
         verbose_name_plural = 'LTI tenant'
+
+
+class LTIOutcomeStatus(object):
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    SUPERSEDED = 'superseded'
+
+
+OUTCOME_STATUS_CHOICES = tuple([
+    (value, value) for attr, value in sorted(LTIOutcomeStatus.__dict__.items()) if not attr.startswith('_')
+])
+
+
+class LTIOutcomeManager(models.Manager):
+
+    def submit(self, tenant, service_url, sourcedid, score):
+        """
+        Queues a score for a result and returns True, or returns False when the score replaced a queued score
+        for the same result that wasn't sent yet. Only the last submitted score of a result gets sent.
+        """
+        if not 0.0 <= score <= 1.0:
+            raise ValueError("Outcome scores should be between 0.0 and 1.0, not {}".format(score))
+        now = timezone.now()
+        outcomes = self.filter(tenant=tenant, sourcedid=sourcedid)
+        coalesced = outcomes.filter(status=LTIOutcomeStatus.PENDING) \
+            .update(score=score, service_url=service_url, modified_at=now)
+        if coalesced:
+            return False
+        # Outcomes that are sending return to pending when they fail, after which they would overwrite this score.
+        # Instead they get superseded and this score waits for their lease to end, when they are done at the latest.
+        sending = outcomes.filter(status=LTIOutcomeStatus.SENDING)
+        lease_ends_at = sending.aggregate(lease_ends_at=Max("next_attempt_at"))["lease_ends_at"]
+        sending.update(status=LTIOutcomeStatus.SUPERSEDED, modified_at=now)
+        self.create(
+            tenant=tenant, service_url=service_url, sourcedid=sourcedid, score=score,
+            next_attempt_at=max(now, lease_ends_at) if lease_ends_at else now
+        )
+        return True
+
+    def claim(self, limit, lease):
+        """
+        Marks at most limit outcomes that are due as sending for lease seconds and returns them with their tenant.
+        Outcomes that are still sending when their lease expires can be claimed again.
+        Outcomes with a newer outcome for the same result get superseded instead,
+        which makes sure that older scores never overwrite newer scores.
+        """
+        now = timezone.now()
+        active = [LTIOutcomeStatus.PENDING, LTIOutcomeStatus.SENDING]
+        newer = self.filter(
+            tenant_id=OuterRef("tenant_id"), sourcedid=OuterRef("sourcedid"), id__gt=OuterRef("id"), status__in=active
+        )
+        candidates = self.filter(status__in=active, next_attempt_at__lte=now) \
+            .annotate(has_newer=Exists(newer)) \
+            .order_by("next_attempt_at", "id") \
+            .values_list("id", "status", "next_attempt_at", "has_newer")[:limit]
+        claimed = []
+        for outcome_id, status, next_attempt_at, has_newer in candidates:
+            # The conditional update makes sure that concurrent workers don't claim the same outcome
+            outcome = self.filter(id=outcome_id, status=status, next_attempt_at=next_attempt_at)
+            if has_newer:
+                outcome.update(status=LTIOutcomeStatus.SUPERSEDED, modified_at=now)
+            elif outcome.update(
+                status=LTIOutcomeStatus.SENDING,
+                next_attempt_at=now + timedelta(seconds=lease),
+                modified_at=now
+            ):
+                claimed.append(outcome_id)
+        return list(self.filter(id__in=claimed).select_related("tenant").order_by("next_attempt_at", "id"))
+
+
+class LTIOutcome(models.Model):
+    """
+    A score for a result in the LMS of a tenant that waits to be sent through the LTI Outcomes service.
+    """
+
+    tenant = models.ForeignKey(LTITenant, on_delete=models.CASCADE, related_name="outcomes")
+    service_url = models.URLField(max_length=512)
+    sourcedid = models.CharField(max_length=255)
+    score = models.FloatField()
+
+    status = models.CharField(max_length=50, choices=OUTCOME_STATUS_CHOICES, default=LTIOutcomeStatus.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    modified_at = models.DateTimeField(auto_now=True, editable=False)
+
+    objects = LTIOutcomeManager()
+
+    def __str__(self):
+        return '{} ({})'.format(self.sourcedid, self.status)
+
+    class Meta:
+        verbose_name = 'LTI outcome'
+        verbose_name_plural = 'LTI outcomes'
+        indexes = [
+            models.Index(fields=['tenant', 'sourcedid', 'status']),
+        ]
+
+
+@receiver(post_save, sender=LTIApp)
+@receiver(post_delete, sender=LTIApp)
+def invalidate_app_cache(sender, instance, **kwargs):
+    keys = {get_app_cache_key(instance.slug)}
+    loaded_slug = getattr(instance, "_loaded_slug", None)
+    if loaded_slug:
+        keys.update([get_app_cache_key(loaded_slug), get_config_version_key(loaded_slug)])
+        launch_dispatcher.discard(loaded_slug)
+    keys.add(get_config_version_key(instance.slug))
+    launch_dispatcher.discard(instance.slug)
+    instance._loaded_slug = instance.slug
+    # Cached tenants hold a copy of their app
+    keys.update(
+        get_tenant_cache_key(client_key)
+        for client_key in LTITenant.objects.filter(app_id=instance.id).values_list("client_key", flat=True)
+    )
+    get_lti_cache().delete_many(list(keys))
+
+
+@receiver(post_save, sender=LTITenant)
+@receiver(post_delete, sender=LTITenant)
+def invalidate_tenant_cache(sender, instance, **kwargs):
+    keys = [get_tenant_cache_key(instance.client_key)]
+    app_ids = {instance.app_id, getattr(instance, "_loaded_app_id", None)}
+    keys += [
+        get_config_version_key(slug)
+        for slug in LTIApp.objects.filter(id__in=app_ids - {None}).values_list("slug", flat=True)
+    ]
+    instance._loaded_app_id = instance.app_id
+    get_lti_cache().delete_many(keys)
@@ -0,0 +1,3 @@
+from ims.parsers.manifest import ParsedManifest
+from ims.parsers.streaming import StreamingManifest
+from ims.parsers.tree import ContentTree, ContentNode
@@ -0,0 +1,46 @@
+from bs4 import BeautifulSoup
+
+
+class ParsedManifest(object):
+    """
+    Parses an imsmanifest.xml once and keeps indexes to the elements that are looked up by identifier.
+    Items and references index the first element in document order, just like BeautifulSoup.find would.
+    Resources index the last element with an identifier, which is how IMSArchive.get_resources always resolved them.
+    """
+
+    def __init__(self, manifest):
+        self.soup = BeautifulSoup(manifest, "lxml")
+        self.items = {}
+        self.references = {}
+        self.resources = {}
+        for element in self.soup.find_all(attrs={'identifierref': True}):
+            self.references.setdefault(element['identifierref'], element)
+        for item in self.soup.find_all('item', identifier=True):
+            self.items.setdefault(item['identifier'], item)
+        for resource in self.soup.find_all('resource', identifier=True):
+            self.resources[resource['identifier']] = resource
+
+    def find(self, *args, **kwargs):
+        return self.soup.find(*args, **kwargs)
+
+    def find_text(self, path):
+        """
+        Follows a path of tag names, where every name is searched for inside the previous element,
+        and returns the text of the last element.
+        """
+        element = self.soup
+        for name in path:
+            element = element.find(name)
+        return element.text
+
+    def get_item(self, identifier):
+        return self.items.get(identifier, None)
+
+    def get_resource(self, identifier):
+        return self.resources.get(identifier, None)
+
+    def get_referencing_element(self, identifier):
+        """
+        Returns the first element that references given identifier, which normally is an organization item.
+        """
+        return self.references.get(identifier, None)
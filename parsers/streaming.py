@@ -0,0 +1,216 @@
+from lxml import etree
+
+
+def get_qualified_name(element):
+    """
+    Returns the tag name of an element the way BeautifulSoup with the lxml HTML parser names it.
+    That is the lower cased local name prefixed with the namespace prefix if there is one.
+    """
+    if not isinstance(element.tag, str):  # comments and processing instructions
+        return None
+    name = etree.QName(element).localname
+    if element.prefix:
+        name = "{}:{}".format(element.prefix, name)
+    return name.lower()
+
+
+def find_descendant(element, name):  # excludes the element itself, like BeautifulSoup.find
+    for descendant in element.iterdescendants():
+        if get_qualified_name(descendant) == name:
+            return descendant
+    return None
+
+
+def get_text(element):
+    return "".join(element.itertext())
+
+
+class StreamingManifest(object):
+    """
+    Parses an imsmanifest.xml incrementally from a file object.
+    Iterating over a StreamingManifest yields (event, identifier, data) tuples for organization items and resources
+    as soon as they are parsed. Elements get freed once they are processed,
+    which keeps memory usage constant regardless of the size of the manifest.
+    The output is equal to what ParsedManifest based methods return,
+    under the assumption that the manifest follows the IMS order of metadata, organizations and then resources.
+    Only titles of referenced identifiers are kept around for the resources that are parsed later.
+    """
+
+    METADATA = "metadata"
+    ITEM = "item"
+    RESOURCE = "resource"
+
+    def __init__(self, file, metadata_paths=tuple()):
+        self.file = file
+        self.metadata_paths = tuple(metadata_paths)
+        self.metadata = {path: None for path in self.metadata_paths}
+        self.references = {}
+        self._metadata_anchors = {}
+        self._resolved_paths = set()
+        self._reference_anchors = {}
+        self._title_waiters = []
+        self._items = []
+        self._item_count = 0
+        self._organization = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if hasattr(self.file, "close"):
+            self.file.close()
+
+    def _start(self, element, name):
+        for path in self.metadata_paths:
+            if path[0] == name and path not in self._metadata_anchors and path not in self._resolved_paths:
+                self._metadata_anchors[path] = element
+        reference = element.get("identifierref", None)
+        is_reference_anchor = reference is not None and reference not in self.references and \
+            reference not in self._reference_anchors
+        if is_reference_anchor:
+            self._reference_anchors[reference] = element
+        if is_reference_anchor:
+            self._title_waiters.append([element, None])
+        if name == "organization":
+            self._organization = element.get("identifier", None)
+        elif name == "item":
+            self._items.append({
+                "element": element,
+                "identifier": element.get("identifier", None),
+                "index": self._item_count,
+                "title": None
+            })
+            self._item_count += 1
+
+    def _end_title(self, element):
+        # Titles do not nest, so the first title that ends inside an element is also its first title descendant
+        title = get_text(element)
+        for waiter in self._title_waiters:
+            if waiter[1] is None:
+                waiter[1] = title
+        if self._items and self._items[-1]["element"] is element.getparent() and self._items[-1]["title"] is None:
+            self._items[-1]["title"] = title
+
+    def _pop_title(self, element):
+        if not self._title_waiters or self._title_waiters[-1][0] is not element:
+            return None
+        return self._title_waiters.pop()[1]
+
+    def _end_metadata_anchors(self, element):
+        resolved = {}
+        for path, anchor in list(self._metadata_anchors.items()):
+            if anchor is not element:
+                continue
+            target = anchor
+            for name in path[1:]:
+                target = find_descendant(target, name)
+                if target is None:
+                    break
+            resolved[path] = get_text(target) if target is not None else None
+            del self._metadata_anchors[path]
+            self._resolved_paths.add(path)
+        self.metadata.update(resolved)
+        return resolved
+
+    def _end_reference_anchor(self, element, title):
+        reference = element.get("identifierref", None)
+        if reference is None or self._reference_anchors.get(reference, None) is not element:
+            return
+        del self._reference_anchors[reference]
+        self.references[reference] = title
+
+    def _end_item(self, element):
+        """
+        Returns the data for an item, which includes its own title rather than the first title of any descendant.
+        Indexes are the positions of items in document order, which makes it possible to restore the hierarchy.
+        """
+        item = self._items.pop()
+        parent = self._items[-1] if self._items else None
+        return {
+            "identifierref": element.get("identifierref", None),
+            "title": item["title"],
+            "parent": parent["identifier"] if parent else None,
+            "index": item["index"],
+            "parent_index": parent["index"] if parent else None,
+            "organization": self._organization
+        }
+
+    def _end_resource(self, element):
+        identifier = element.get("identifier", None)
+        if identifier is None:
+            return None
+        return {
+            "title": self.references.get(identifier, None),
+            "content_type": element.attrib["type"],
+            "main": element.get("href", None),
+            "files": [
+                file.attrib["href"] for file in element.iterdescendants()
+                if get_qualified_name(file) == "file"
+            ]
+        }
+
+    @staticmethod
+    def _free(element):
+        element.clear()
+        parent = element.getparent()
+        while parent is not None and element.getprevious() is not None:
+            del parent[0]
+
+    def iterparse(self):
+        events = etree.iterparse(self.file, events=("start", "end",), huge_tree=True, resolve_entities=False,
+                                 no_network=True)
+        for event, element in events:
+            name = get_qualified_name(element)
+            if name is None:
+                continue
+            if event == "start":
+                self._start(element, name)
+                continue
+            if self._metadata_anchors:
+                resolved = self._end_metadata_anchors(element)
+                if resolved:
+                    yield self.METADATA, None, resolved
+            title = self._pop_title(element)
+            if self._reference_anchors:
+                self._end_reference_anchor(element, title)
+            if name == "title":
+                self._end_title(element)
+            elif name == "item":
+                data = self._end_item(element)
+                yield self.ITEM, element.get("identifier", None), data
+                self._free(element)
+            elif name == "resource":
+                data = self._end_resource(element)
+                if data is not None:
+                    yield self.RESOURCE, element.get("identifier"), data
+                self._free(element)
+            elif name == "organization":
+                self._free(element)
+            elif name == "metadata" and element.getparent() is not None and element.getparent().getparent() is None:
+                self._free(element)  # only manifest level metadata, because items and resources may contain metadata
+
+    def __iter__(self):
+        return self.iterparse()
+
+    def iter_resources(self):
+        for event, identifier, data in self:
+            if event == self.RESOURCE:
+                yield identifier, data
+
+    def get_resources(self):
+        return dict(self.iter_resources())
+
+    def get_metadata(self):
+        """
+        Parses until all metadata paths have been found and returns a dictionary with the text for every path.
+        Paths that are not present in the manifest will have None as a value.
+        """
+        paths = set(self.metadata_paths)
+        if not paths.issubset(self._resolved_paths):
+            for event, identifier, data in self:
+                if event == self.METADATA and paths.issubset(self._resolved_paths):
+                    break
+        return self.metadata
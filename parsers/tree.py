@@ -0,0 +1,179 @@
+import json
+
+
+class ContentNode(object):
+    """
+    A lightweight view on a single node of a ContentTree.
+    """
+
+    __slots__ = ("tree", "index",)
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def identifier(self):
+        return self.tree.identifiers[self.index]
+
+    @property
+    def title(self):
+        return self.tree.titles[self.index]
+
+    @property
+    def identifierref(self):
+        return self.tree.identifierrefs[self.index]
+
+    @property
+    def parent(self):
+        parent = self.tree.parents[self.index]
+        return ContentNode(self.tree, parent) if parent >= 0 else None
+
+    @property
+    def children(self):
+        return [ContentNode(self.tree, child) for child in self.tree.get_children(self.index)]
+
+    def __eq__(self, other):
+        return isinstance(other, ContentNode) and other.tree is self.tree and other.index == self.index
+
+    def __repr__(self):
+        return "<ContentNode {} {}>".format(self.identifier, self.title)
+
+
+class ContentTree(object):
+    """
+    Holds the items of an organization as flat lists, where nodes are stored in document order
+    and every node refers to the index of its parent or -1 for top level items.
+    The lists serialize to compact JSON and don't hold on to any parsed XML.
+    """
+
+    VERSION = 1
+
+    __slots__ = ("parents", "identifiers", "titles", "identifierrefs", "_children",)
+
+    def __init__(self):
+        self.parents = []
+        self.identifiers = []
+        self.titles = []
+        self.identifierrefs = []
+        self._children = None
+
+    def add(self, parent, identifier, title, identifierref):
+        """
+        Adds a node and returns its index. Parents need to be added before their children.
+        """
+        if parent >= len(self.parents):
+            raise ValueError("Parents need to be added before their children")
+        self.parents.append(parent)
+        self.identifiers.append(identifier)
+        self.titles.append(title)
+        self.identifierrefs.append(identifierref)
+        self._children = None
+        return len(self.parents) - 1
+
+    def __len__(self):
+        return len(self.parents)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ContentNode(self, index)
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError("ContentTree index out of range")
+        return ContentNode(self, index)
+
+    def get_children(self, index):
+        """
+        Returns the indexes of the children of the node at index. Use -1 to get the indexes of top level nodes.
+        """
+        if self._children is None:
+            self._children = {}
+            for child, parent in enumerate(self.parents):
+                self._children.setdefault(parent, []).append(child)
+        return self._children.get(index, [])
+
+    @property
+    def roots(self):
+        return [ContentNode(self, index) for index in self.get_children(-1)]
+
+    @classmethod
+    def from_items(cls, items):
+        """
+        Creates a ContentTree from the item data of a StreamingManifest for the first organization in the manifest.
+        Items arrive after their children, so they get sorted into document order first.
+        """
+        organization = None
+        ordered = []
+        for item in items:
+            if organization is None:
+                organization = item["organization"]
+            if item["organization"] == organization:
+                ordered.append(item)
+        ordered.sort(key=lambda item: item["index"])
+        tree = cls()
+        positions = {}
+        for item in ordered:
+            parent = positions.get(item["parent_index"], -1)
+            positions[item["index"]] = tree.add(parent, item["identifier"], item["title"], item["identifierref"])
+        return tree
+
+    @classmethod
+    def from_parsed_manifest(cls, manifest):
+        tree = cls()
+        organization = manifest.find("organization")
+        if organization is None:
+            return tree
+        positions = {}
+        for item in organization.find_all("item"):
+            parent_item = item.find_parent("item")
+            parent = positions.get(id(parent_item), -1) if parent_item is not None else -1
+            title = item.find("title", recursive=False)
+            positions[id(item)] = tree.add(
+                parent,
+                item.get("identifier", None),
+                title.text if title else None,
+                item.get("identifierref", None)
+            )
+        return tree
+
+    def dumps(self):
+        nodes = [
+            [parent, identifier, title, identifierref]
+            for parent, identifier, title, identifierref
+            in zip(self.parents, self.identifiers, self.titles, self.identifierrefs)
+        ]
+        return json.dumps({"version": self.VERSION, "nodes": nodes}, separators=(",", ":",))
+
+    @classmethod
+    def loads(cls, value):
+        data = json.loads(value)
+        if data.get("version", None) != cls.VERSION:
+            raise ValueError("Unsupported ContentTree version {}".format(data.get("version", None)))
+        tree = cls()
+        for parent, identifier, title, identifierref in data["nodes"]:
+            tree.add(parent, identifier, title, identifierref)
+        return tree
+
+    def iter_json(self):
+        """
+        Yields the tree as nested JSON in small chunks, which is suitable for a StreamingHttpResponse.
+        """
+        yield "["
+        stack = [iter(self.get_children(-1))]
+        first = True
+        while stack:
+            index = next(stack[-1], None)
+            if index is None:
+                stack.pop()
+                yield "]}" if stack else "]"
+                first = False
+                continue
+            node = json.dumps({
+                "identifier": self.identifiers[index],
+                "title": self.titles[index],
+                "identifierref": self.identifierrefs[index]
+            })
+            yield ("" if first else ",") + node[:-1] + ',"children":['
+            first = True
+            stack.append(iter(self.get_children(index)))
@@ -1 +1,7 @@
-from ims.views.lti import lti_config, lti_launch, lti_debug_launch
+from ims.views.lti import lti_config, lti_configs_export, lti_launch, lti_debug_launch, lti_launch_metrics
+from ims.views.content import archive_outline
+
+try:
+    from ims.views.lti_async import async_lti_launch, async_lti_config, async_lti_debug_launch
+except ImportError:  # asgiref is only available from Django 3.0 onwards
+    pass
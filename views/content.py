@@ -0,0 +1,9 @@
+from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
+
+from ims.models import IMSArchive
+
+
+def archive_outline(request, pk):
+    archive = get_object_or_404(IMSArchive.objects.only('id', 'file', 'outline'), pk=pk)
+    return StreamingHttpResponse(archive.get_outline().iter_json(), content_type='application/json')
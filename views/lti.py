@@ -1,67 +1,186 @@
+from hashlib import md5
+from uuid import uuid4
+
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden, Http404, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.template.response import TemplateResponse
-from django.contrib.auth import authenticate, login
-from django.urls import reverse, resolve
+from django.contrib.admin.views.decorators import staff_member_required
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.contrib.auth import authenticate, login, SESSION_KEY, HASH_SESSION_KEY
+from django.utils.crypto import constant_time_compare
 
+from lti import InvalidLTIRequestError
 from lti.contrib.django import DjangoToolProvider
 
 from ims.authorization import LTIRequestValidator
+from ims.dispatch import launch_dispatcher
 from ims.models import LTIApp, LTIPrivacyLevels, LTITenant
-from ims.models.lti import LearningManagementSystems
+from ims.models.lti import (LearningManagementSystems, LTI_CACHE_TIMEOUT, get_lti_cache,
+                            get_config_version_key)
+from ims.archives.zipstream import stream_zip
+from ims.instrumentation import get_launch_timer, null_launch_timer, launch_histogram
+
+
+def get_cached_app_or_404(slug):
+    try:
+        return LTIApp.objects.get_cached(slug)
+    except LTIApp.DoesNotExist:
+        raise Http404('No LTIApp matches the given query.')
+
+
+def login_launch_user(request, user):
+    """
+    Logs in the user unless the session belongs to that user already.
+    Logging in again would only rotate the session key and update last_login.
+    """
+    is_logged_in = request.session.get(SESSION_KEY, None) == user._meta.pk.value_to_string(user) and \
+        constant_time_compare(request.session.get(HASH_SESSION_KEY, ''), user.get_session_auth_hash())
+    if not is_logged_in:
+        login(request, user)
+    request.user = user
+
+
+def start_launch(request, app, tenant, timer=null_launch_timer):
+    # First thing is to create and login a user, because this influences the session
+    if app.privacy_level != LTIPrivacyLevels.ANONYMOUS:
+        with timer.phase("authentication"):
+            user = authenticate(request, remote_user=request.POST.get("lis_person_contact_email_primary"))
+            if user is not None:
+                login_launch_user(request, user)
+
+    # After we have a user we're gonna set its session based on tenant settings
+    # This authorizes a user to use tenant LMS API's
+    with timer.phase("session"):
+        tenant.start_session(request, request.POST.dict())
 
 
 @csrf_exempt
 def lti_launch(request, slug):
-    app = get_object_or_404(LTIApp, slug=slug)
-    tool_provider = DjangoToolProvider.from_django_request(request=request)
+    # The validator looks up the tenant together with its app,
+    # so we only need to lookup the app separately when the launch is not for the app of the tenant
+    timer = get_launch_timer()
     validator = LTIRequestValidator()
-    ok = tool_provider.is_valid_request(validator)
+    try:
+        tool_provider = DjangoToolProvider.from_django_request(request=request)
+        with timer.phase("tenant"):
+            validator.get_tenant(tool_provider.consumer_key)  # memoized for the signature check
+        with timer.phase("signature"):
+            ok = tool_provider.is_valid_request(validator)
+    except InvalidLTIRequestError:
+        ok = False
     if not ok:
+        get_cached_app_or_404(slug)
         return HttpResponseForbidden('The launch request is considered invalid')
 
     client_key = tool_provider.consumer_key  # request would not be ok if this is not set
-    try:
-        tenant = app.ltitenant_set.get(client_key=client_key)
-    except LTITenant.DoesNotExist:
+    tenant = validator.get_tenant(client_key)
+    app = tenant.app
+    if app.slug != slug:
+        app = get_cached_app_or_404(slug)
         return HttpResponseForbidden('{} does not have access to app {}'.format(client_key, app))
 
-    # First thing is to create and login a user, because this influences the session
-    if app.privacy_level != LTIPrivacyLevels.ANONYMOUS:
-        user = authenticate(request, remote_user=request.POST.get("lis_person_contact_email_primary"))
-        if user is not None:
-            login(request, user)
-
-    # After we have a user we're gonna set its session based on tenant settings
-    # This authorizes a user to use tenant LMS API's
-    tenant.start_session(request, request.POST.dict())
+    start_launch(request, app, tenant, timer)
 
-    # Lookup the view and return its response
+    # Dispatch to the view and return its response
     # Redirect impossible because we need to set cookies for sessions
-    url = reverse(app.view)
-    view = resolve(url)
-    return view.func(request)
+    with timer.phase("view"):
+        response = launch_dispatcher.dispatch(request, app)
+    return timer.finish(request, response)
 
 
-def lti_config(request, app_slug, tenant_slug):
-    if tenant_slug != app_slug:
-        tenant = get_object_or_404(LTITenant, app__slug=app_slug, slug=tenant_slug)
-        app = tenant.app
-    else:
-        tenant = None
-        app = get_object_or_404(LTIApp, slug=app_slug)
-    return TemplateResponse(request, "ims/lti_config.xml", {
-        "host": request.get_host(),
+def render_lti_config(app, tenant, host, request=None):
+    return render_to_string("ims/lti_config.xml", {
+        "host": host,
         "app": app,
         "tenant": tenant,
         "lms": LearningManagementSystems
-    })
+    }, request=request)
 
 
-@csrf_exempt
-def lti_debug_launch(request, slug):
-    app = get_object_or_404(LTIApp, slug=slug)
+def get_lti_config_validators(app, tenant, host):
+    """
+    Returns the ETag and last modification timestamp for the configuration of a tenant or the app without tenant.
+    """
+    last_modified = max(app.modified_at, tenant.modified_at) if tenant else app.modified_at
+    fingerprint = "{}:{}:{}:{}:{}".format(
+        app.id, app.modified_at.isoformat(),
+        tenant.client_key if tenant else "", tenant.modified_at.isoformat() if tenant else "",
+        host
+    )
+    return quote_etag(md5(fingerprint.encode("utf-8")).hexdigest()), int(last_modified.timestamp())
+
+
+def get_lti_config(request, app_slug, tenant_slug):
+    """
+    Returns the ETag, last modification timestamp and rendered content of a configuration.
+    Rendered configurations get cached with their validators, which means that repeated requests
+    including conditional requests don't need any queries or template rendering.
+    """
+    host = request.get_host()
+    cache = get_lti_cache()
+    version_key = get_config_version_key(app_slug)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid4().hex, None)
+        version = cache.get(version_key)
+    key = "ims:lti:config:{}:{}:{}:{}".format(app_slug, tenant_slug, host, version)
+    cached = cache.get(key) if version else None
+    if cached is None:
+        if tenant_slug != app_slug:
+            tenant = get_object_or_404(LTITenant.objects.select_related("app"), app__slug=app_slug, slug=tenant_slug)
+            app = tenant.app
+        else:
+            tenant = None
+            app = get_object_or_404(LTIApp, slug=app_slug)
+        etag, last_modified = get_lti_config_validators(app, tenant, host)
+        cached = (etag, last_modified, render_lti_config(app, tenant, host, request=request),)
+        if version:
+            cache.set(key, cached, LTI_CACHE_TIMEOUT)
+    return cached
+
+
+def get_lti_config_response(request, config):
+    etag, last_modified, content = config
+    response = HttpResponse(content)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+
+
+def lti_config(request, app_slug, tenant_slug):
+    return get_lti_config_response(request, get_lti_config(request, app_slug, tenant_slug))
+
+
+def iter_lti_config_files(app, host):
+    """
+    Yields file names and content of the configurations of all tenants of an app.
+    """
+    tenants = app.ltitenant_set.order_by("slug", "client_key")
+    for tenant in tenants.iterator():
+        tenant.app = app
+        yield "{}-{}.xml".format(tenant.slug, tenant.client_key), render_lti_config(app, tenant, host)
+
+
+@staff_member_required
+def lti_configs_export(request, app_slug):
+    app = get_object_or_404(LTIApp, slug=app_slug)
+    response = StreamingHttpResponse(
+        stream_zip(iter_lti_config_files(app, request.get_host())),
+        content_type="application/zip"
+    )
+    response["Content-Disposition"] = 'attachment; filename="{}-configs.zip"'.format(app.slug)
+    return response
+
+
+@staff_member_required
+def lti_launch_metrics(request):
+    return HttpResponse(launch_histogram.to_prometheus(), content_type="text/plain; version=0.0.4")
+
+
+def start_debug_launch(request, slug):
+    app = get_cached_app_or_404(slug)
     client_key = request.GET.get('client_key', None)
     if client_key:
         tenant = app.ltitenant_set.get(client_key=client_key)
@@ -71,10 +190,13 @@ def lti_debug_launch(request, slug):
     if app.privacy_level != LTIPrivacyLevels.ANONYMOUS:
         user = authenticate(request, remote_user=request.GET.get('user', 'debug-user'))
         if user is not None:
-            login(request, user)
+            login_launch_user(request, user)
+    return app
+
 
-    # Lookup the view and return its response
+@csrf_exempt
+def lti_debug_launch(request, slug):
+    app = start_debug_launch(request, slug)
+    # Dispatch to the view and return its response
     # Redirect impossible because we need to set cookies for sessions
-    url = reverse(app.view)
-    view = resolve(url)
-    return view.func(request)
+    return launch_dispatcher.dispatch(request, app)
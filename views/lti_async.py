@@ -0,0 +1,61 @@
+from asgiref.sync import sync_to_async
+
+from django.http import HttpResponseForbidden
+
+from lti import InvalidLTIRequestError
+from lti.contrib.django import DjangoToolProvider
+
+from ims.authorization import LTIRequestValidator
+from ims.dispatch import launch_dispatcher
+from ims.instrumentation import get_launch_timer
+from ims.views.lti import (get_cached_app_or_404, start_launch, start_debug_launch, get_lti_config,
+                           get_lti_config_response)
+
+
+# These views do the same as their synchronous counterparts in ims.views.lti.
+# Work that needs the database, cache or session is grouped into as few sync_to_async calls as possible,
+# while validation of signatures and dispatching to async views happens on the event loop.
+# Views are exempted from CSRF through an attribute, because csrf_exempt only wraps async views from Django 5.0.
+# Launch phases that run on the event loop don't count queries, because their queries happen in other threads.
+
+
+async def async_lti_launch(request, slug):
+    timer = get_launch_timer()
+    validator = LTIRequestValidator()
+    try:
+        tool_provider = DjangoToolProvider.from_django_request(request=request)
+        with timer.phase("validation", queries=False):
+            ok = await validator.ais_valid_request(tool_provider)
+    except InvalidLTIRequestError:
+        ok = False
+    if not ok:
+        await sync_to_async(get_cached_app_or_404)(slug)
+        return HttpResponseForbidden('The launch request is considered invalid')
+
+    client_key = tool_provider.consumer_key  # request would not be ok if this is not set
+    tenant = validator.get_tenant(client_key)  # memoized during validation
+    app = tenant.app
+    if app.slug != slug:
+        app = await sync_to_async(get_cached_app_or_404)(slug)
+        return HttpResponseForbidden('{} does not have access to app {}'.format(client_key, app))
+
+    await sync_to_async(start_launch)(request, app, tenant, timer)
+    with timer.phase("view", queries=False):
+        response = await launch_dispatcher.adispatch(request, app)
+    return timer.finish(request, response)
+
+
+async_lti_launch.csrf_exempt = True
+
+
+async def async_lti_config(request, app_slug, tenant_slug):
+    config = await sync_to_async(get_lti_config)(request, app_slug, tenant_slug)
+    return get_lti_config_response(request, config)
+
+
+async def async_lti_debug_launch(request, slug):
+    app = await sync_to_async(start_debug_launch)(request, slug)
+    return await launch_dispatcher.adispatch(request, app)
+
+
+async_lti_debug_launch.csrf_exempt = True